@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Writes synthetic PubMed Central bulk archives (articles.*.tar.gz) that the
+pmc source can read like the real ones, for measuring throughput without
+downloading them.
+
+usage:  benchmarks/corpus.py [directory] [--articles N] [--archives N]
+            [--size-median BYTES] [--size-sigma S] [--materials SHARE]
+            [--license-text SHARE] [--unknown-licenses SHARE] [--seed N]
+"""
+
+import random
+import tarfile
+
+from cStringIO import StringIO
+from getopt import gnu_getopt, GetoptError
+from math import exp
+from os import makedirs, path
+from sys import argv, exit, path as sys_path, stderr
+from xml.sax.saxutils import escape
+
+sys_path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from sources.pmc import license_url_equivalents
+
+# Same names as the archives of the PMC Open Access subset.
+ARCHIVE_NAMES = ['articles.A-B.tar.gz', 'articles.C-H.tar.gz',
+    'articles.I-N.tar.gz', 'articles.O-Z.tar.gz']
+
+JOURNALS = ['BMC_Biol', 'Parasit_Vectors', 'PLoS_One', 'PLoS_Biol',
+    'Nucleic_Acids_Res', 'J_Vis_Exp', 'Front_Neurosci', 'Sci_Rep']
+
+WORDS = ('the of and in to a is that for with was as by on are were from '
+    'cells protein expression at be this which or an these gene we not '
+    'data analysis study results using effect between infection mice '
+    'larvae worm cysteine proteinase papain video microscope figure '
+    'significantly observed increased samples model control response').split()
+
+LICENSE_URLS = ['http://creativecommons.org/licenses/by/2.0',
+    'http://creativecommons.org/licenses/by/2.5',
+    'http://creativecommons.org/licenses/by/3.0',
+    'http://creativecommons.org/licenses/by-nc/3.0',
+    'http://creativecommons.org/licenses/by-sa/3.0']
+
+# (mimetype, mime-subtype, extension) of supplementary materials
+MEDIA_TYPES = [('video', 'mpeg', 'mpg'), ('video', 'quicktime', 'mov'),
+    ('video', 'avi', 'avi'), ('video', 'mp4', 'mp4'),
+    ('application', 'pdf', 'pdf'), ('application', 'msword', 'doc'),
+    ('audio', 'mpeg', 'mp3'), ('image', 'tiff', 'tif')]
+
+def _paragraphs(rng, count=256):
+    """
+    Returns a pool of paragraphs with inline markup to build bodies from.
+    """
+    pool = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for j in range(rng.randint(40, 160))]
+        words[rng.randrange(len(words))] = '<italic>%s</italic>' % \
+            rng.choice(WORDS)
+        words[rng.randrange(len(words))] = \
+            '<xref ref-type="bibr" rid="B%d">%d</xref>' % (i, i)
+        pool.append('<p>%s.</p>' % ' '.join(words))
+    return pool
+
+def _license_statement(rng, unknown_licenses, number):
+    """
+    Returns a known plain text license statement with varying whitespace
+    and case or, at the given rate, a statement that cannot be resolved.
+    """
+    if rng.random() < unknown_licenses:
+        return 'This article may be reused under licence %d of the ' \
+            'publisher, see the journal website.' % rng.randrange(number)
+    statement = rng.choice(sorted(license_url_equivalents.keys()))
+    if rng.random() < 0.5:  # variations the resolver has to normalise
+        statement = statement.replace(' ', '  ', 1)
+    if rng.random() < 0.2:
+        statement = statement.upper()
+    return statement
+
+def _license(rng, license_text, unknown_licenses, number):
+    """
+    Returns a license element, with an xlink:href to a license URL or, at
+    the given rate, with a plain text statement.
+    """
+    if rng.random() >= license_text:
+        return '<license xlink:href="%s"><p>Open Access.</p></license>' % \
+            rng.choice(LICENSE_URLS)
+    return '<license><p>%s</p></license>' % \
+        escape(_license_statement(rng, unknown_licenses, number))
+
+def _article(rng, paragraphs, number, journal, size, materials,
+    license_text, unknown_licenses):
+    """
+    Returns the NXML of a synthetic article of roughly size bytes.
+    """
+    sups = []
+    xrefs = []
+    if rng.random() < materials:
+        for i in range(1, rng.choice([1, 1, 1, 2, 3, 5]) + 1):
+            mimetype, subtype, extension = rng.choice(MEDIA_TYPES)
+            sups.append(
+                '<supplementary-material id="S%d" content-type="local-data">'
+                '<label>Additional file %d</label><caption><p>Movie showing '
+                '<italic>%s</italic> specimen %d.</p></caption>'
+                '<media xlink:href="%d-S%d.%s" mimetype="%s" '
+                'mime-subtype="%s"/></supplementary-material>' % (i, i,
+                rng.choice(WORDS), i, number, i, extension, mimetype, subtype))
+            xrefs.append('<p>See <xref ref-type="supplementary-material" '
+                'rid="S%d">Additional file %d</xref>.</p>' % (i, i))
+
+    front = (
+        '<front><journal-meta><journal-id journal-id-type="nlm-ta">%s'
+        '</journal-id><journal-title>%s</journal-title></journal-meta>'
+        '<article-meta><article-id pub-id-type="pmc">%d</article-id>'
+        '<article-id pub-id-type="doi">10.9999/synthetic.%d</article-id>'
+        '<title-group><article-title>Synthetic article %d on <italic>%s'
+        '</italic></article-title></title-group><contrib-group>%s'
+        '</contrib-group><pub-date pub-type="epub"><day>%d</day>'
+        '<month>%d</month><year>%d</year></pub-date><permissions>'
+        '<copyright-holder>Author %d et al.</copyright-holder>%s'
+        '</permissions><abstract><p>%s</p></abstract></article-meta></front>'
+    ) % (journal, journal.replace('_', ' '), number, number, number,
+        rng.choice(WORDS), ''.join(
+            '<contrib contrib-type="author"><name><surname>Author%d</surname>'
+            '<given-names>A%d</given-names></name></contrib>' % (i, i)
+            for i in range(rng.randint(1, 8))
+        ), rng.randint(1, 28), rng.randint(1, 12), rng.randint(2003, 2012),
+        number, _license(rng, license_text, unknown_licenses, number),
+        ' '.join(rng.choice(WORDS) for i in range(rng.randint(80, 250))))
+
+    body = []
+    length = len(front)
+    while length < size:
+        paragraph = rng.choice(paragraphs)
+        body.append(paragraph)
+        length += len(paragraph)
+    for xref in xrefs:  # references somewhere in the body
+        body.insert(rng.randint(0, len(body)), xref)
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!DOCTYPE article PUBLIC "-//NLM//DTD Journal Archiving and '
+        'Interchange DTD v3.0 20080202//EN" "archivearticle3.dtd">\n'
+        '<article xmlns:xlink="http://www.w3.org/1999/xlink" '
+        'article-type="research-article">%s<body><sec><title>Results</title>'
+        '%s</sec></body><back>%s</back></article>'
+    ) % (front, ''.join(body), ''.join(sups))
+
+def generate(directory, articles, archives=4, size_median=40000,
+    size_sigma=0.8, materials=0.05, license_text=0.3, unknown_licenses=0.02,
+    seed=1):
+    """
+    Writes articles synthetic articles into archives archives. Article
+    sizes are lognormally distributed around size_median bytes. The given
+    shares of articles have supplementary materials and plain text license
+    statements instead of license URLs; the given share of those statements
+    cannot be resolved. The same seed gives the same archives.
+    """
+    rng = random.Random(seed)
+    paragraphs = _paragraphs(rng)
+    if not path.isdir(directory):
+        makedirs(directory)
+    number = 1000000
+    for archive in range(archives):
+        count = articles // archives + (archive < articles % archives)
+        filename = path.join(directory, ARCHIVE_NAMES[archive % 4] \
+            if archives <= 4 else 'articles.%d.tar.gz' % archive)
+        with tarfile.open(filename, 'w:gz', compresslevel=6) as tar:
+            for i in range(count):
+                number += 1
+                journal = rng.choice(JOURNALS)
+                size = int(size_median * exp(rng.gauss(0, size_sigma)))
+                data = _article(rng, paragraphs, number, journal, size,
+                    materials, license_text, unknown_licenses)
+                info = tarfile.TarInfo('%s/%s_%d.nxml' % (journal, journal,
+                    number))
+                info.size = len(data)
+                info.mtime = 1338422400  # 2012-05-31
+                tar.addfile(info, StringIO(data))
+
+if __name__ == '__main__':
+    try:
+        directory = argv[1]
+    except IndexError:
+        stderr.write(__doc__)
+        exit(1)
+
+    try:
+        options, arguments = gnu_getopt(argv[2:], '', ['articles=',
+            'archives=', 'size-median=', 'size-sigma=', 'materials=',
+            'license-text=', 'unknown-licenses=', 'seed='])
+        options = dict(options)
+        settings = {
+            'articles': int(options.get('--articles', 10000)),
+            'archives': int(options.get('--archives', 4)),
+            'size_median': int(options.get('--size-median', 40000)),
+            'size_sigma': float(options.get('--size-sigma', 0.8)),
+            'materials': float(options.get('--materials', 0.05)),
+            'license_text': float(options.get('--license-text', 0.3)),
+            'unknown_licenses': float(options.get('--unknown-licenses', 0.02)),
+            'seed': int(options.get('--seed', 1))
+        }
+    except (GetoptError, ValueError), e:  # invalid option or option value
+        stderr.write('Invalid option: %s\n' % str(e))
+        exit(1)
+
+    stderr.write("Writing %d synthetic articles into “%s” …\n" % \
+        (settings['articles'], directory))
+    generate(directory, **settings)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures how many rows per second list-articles exports in every format,
+uncompressed and compressed, for all default fields and for a projection
+to two fields. Articles are listed from a synthetic corpus written by
+corpus.py once and kept in memory, so only exporting is timed; the best
+of several runs is reported. Results are appended to a JSON lines file.
+
+usage:  benchmarks/export.py [--articles N] [--corpus DIRECTORY]
+            [--runs N] [--output FILE]
+"""
+
+from datetime import datetime
+from getopt import gnu_getopt, GetoptError
+from os import close, path, remove
+from sys import argv, exit, stderr, stdout
+from tempfile import gettempdir, mkstemp
+
+import throughput  # adds the repository to the module path
+from helpers import export, stats
+from sources import pmc
+
+COMPRESSIONS = ['', '.gz', '.bz2']
+
+PROJECTION = ['name', 'title']
+
+def export_articles(articles, output_format, fields, compression):
+    """
+    Exports articles to a temporary file and returns wall clock and CPU
+    seconds and the size of the file in bytes.
+    """
+    handle, filename = mkstemp(suffix=compression)
+    close(handle)
+    try:
+        stopwatch = stats.Stopwatch()
+        f = export.open_output(filename)
+        writer = export.Writer(f, output_format, fields)
+        writer.write_header()
+        for article in articles:
+            writer.write(article)
+        writer.close()
+        f.close()
+        wall, cpu = stopwatch.read()
+        return wall, cpu, path.getsize(filename)
+    finally:
+        remove(filename)
+
+if __name__ == '__main__':
+    try:
+        options, arguments = gnu_getopt(argv[1:], '', ['articles=', 'corpus=',
+            'runs=', 'output='])
+        options = dict(options)
+        articles = int(options.get('--articles', 10000))
+        runs = int(options.get('--runs', 3))
+        corpus_directory = options.get('--corpus',
+            path.join(gettempdir(), 'oa-benchmark-corpus'))
+        output = options.get('--output',
+            path.join(corpus_directory, 'export.jsonl'))
+    except (GetoptError, ValueError), e:  # invalid option or option value
+        stderr.write('Invalid option: %s\n' % str(e))
+        exit(1)
+
+    corpus_path = throughput.get_corpus(corpus_directory, articles)
+    stderr.write("Listing articles in “%s” …\n" % corpus_path)
+    results = list(pmc.list_articles(corpus_path))
+    revision = throughput.get_revision()
+
+    stdout.write('%-6s %-5s %-10s %8s %10s %12s %10s\n' % ('format',
+        'comp.', 'fields', 'rows', 'seconds', 'rows/s', 'MB'))
+    for output_format in export.FORMATS:
+        for fields in [export.DEFAULT_FIELDS, PROJECTION]:
+            for compression in COMPRESSIONS:
+                wall, cpu, size = min(
+                    export_articles(results, output_format, fields,
+                        compression)
+                    for run in range(runs)
+                )
+                record = {
+                    'benchmark': 'export',
+                    'format': output_format,
+                    'compression': compression.lstrip('.') or None,
+                    'fields': fields,
+                    'articles': len(results),
+                    'revision': revision,
+                    'date': datetime.utcnow().isoformat(),
+                    'seconds': wall,
+                    'cpu-seconds': cpu,
+                    'bytes': size,
+                    'rate': len(results) / wall
+                }
+                stats.append_record(output, record)
+                stdout.write('%-6s %-5s %-10s %8d %10.3f %12.1f %10.1f\n' % (
+                    output_format,
+                    record['compression'] or '-',
+                    'default' if fields == export.DEFAULT_FIELDS else \
+                        ','.join(fields),
+                    len(results),
+                    wall,
+                    record['rate'],
+                    size / 1048576.0
+                ))
+                stdout.flush()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Runs find-media on a synthetic corpus written by corpus.py once in one
+process and once in N processes with a shard each, merges the shards and
+checks that the merged state has the same articles and materials as the
+state written by one process. Both runs use empty XDG directories of their
+own. Exits with status 4 if the states differ.
+
+usage:  benchmarks/shards.py [--shards N] [--articles N] [--corpus DIRECTORY]
+"""
+
+import sqlite3
+
+from getopt import gnu_getopt, GetoptError
+from os import devnull, environ, listdir, makedirs, path, symlink
+from shutil import rmtree
+from subprocess import call, Popen
+from sys import argv, exit, executable, stderr, stdout
+from tempfile import gettempdir, mkdtemp
+from time import time
+
+import throughput  # adds the repository to the module path
+from helpers.state import STATE_FILENAME
+
+def make_cache(corpus_path):
+    """
+    Returns XDG directories with the archives of a corpus as pmc metadata.
+    """
+    directory = mkdtemp()
+    environment = dict(environ,
+        XDG_CACHE_HOME=path.join(directory, 'cache'),
+        XDG_CONFIG_HOME=path.join(directory, 'config'),
+        XDG_DATA_HOME=path.join(directory, 'data'))
+    raw_path = path.join(directory, 'cache', 'open-access-media-importer',
+        'metadata', 'raw', 'pmc')
+    makedirs(raw_path)
+    for filename in listdir(corpus_path):
+        if filename.endswith('.tar.gz'):
+            symlink(path.join(corpus_path, filename),
+                path.join(raw_path, filename))
+    return directory, environment
+
+def oa_cache(arguments):
+    return [executable, path.join(throughput.ROOT, 'oa-cache')] + arguments
+
+def read_state(directory):
+    """
+    Returns all rows of the articles and materials tables of a state file,
+    without the times they were modified, which differ between runs.
+    """
+    connection = sqlite3.connect(path.join(directory, 'cache',
+        'open-access-media-importer', 'metadata', 'refined', 'pmc',
+        STATE_FILENAME))
+    rows = []
+    for table in ['articles', 'materials']:
+        columns = [
+            row[1] for row in
+            connection.execute('PRAGMA table_info(%s)' % table)
+            if row[1] != 'modified'
+        ]
+        rows.append(connection.execute('SELECT %s FROM %s ORDER BY 1, 2' % \
+            (','.join(columns), table)).fetchall())
+    connection.close()
+    return rows
+
+if __name__ == '__main__':
+    try:
+        options, arguments = gnu_getopt(argv[1:], '', ['shards=', 'articles=',
+            'corpus='])
+        options = dict(options)
+        shards = int(options.get('--shards', 4))
+        articles = int(options.get('--articles', 2000))
+        corpus_directory = options.get('--corpus',
+            path.join(gettempdir(), 'oa-benchmark-corpus'))
+    except (GetoptError, ValueError), e:  # invalid option or option value
+        stderr.write('Invalid option: %s\n' % str(e))
+        exit(1)
+
+    corpus_path = throughput.get_corpus(corpus_directory, articles)
+    single_directory, single_environment = make_cache(corpus_path)
+    sharded_directory, sharded_environment = make_cache(corpus_path)
+    try:
+        with open(devnull, 'w') as null:
+            started = time()
+            call(oa_cache(['find-media', 'pmc', '--quiet']),
+                env=single_environment, stderr=null)
+            single_seconds = time() - started
+
+            started = time()
+            processes = [
+                Popen(oa_cache(['find-media', 'pmc', '--quiet',
+                    '--shard', '%d/%d' % (k, shards)]),
+                    env=sharded_environment, stderr=null)
+                for k in range(1, shards + 1)
+            ]
+            for process in processes:
+                process.wait()
+            call(oa_cache(['merge-shards', 'pmc']), env=sharded_environment,
+                stderr=null)
+            sharded_seconds = time() - started
+
+        identical = read_state(single_directory) == \
+            read_state(sharded_directory)
+    finally:
+        rmtree(single_directory)
+        rmtree(sharded_directory)
+
+    stdout.write('%d articles, 1 process: %.2f seconds, %d shards: %.2f '
+        'seconds (with merging), states %s.\n' % (articles, single_seconds,
+        shards, sharded_seconds, 'identical' if identical else 'differ'))
+    if not identical:
+        exit(4)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures how long each command takes to start and finish when it has
+nothing to do, using the dummy source and empty XDG directories, without
+a user configuration.
+
+usage:  benchmarks/startup.py [runs]
+"""
+
+from os import devnull, environ, path
+from shutil import rmtree
+from subprocess import call
+from sys import argv, executable, stdout
+from tempfile import mkdtemp
+from time import time
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+COMMANDS = [
+    ['oa-get'],  # usage only, measures imports
+    ['oa-get', 'download-media', 'dummy'],
+    ['oa-cache'],
+    ['oa-cache', 'clear-metadata', 'dummy'],
+    ['oa-cache', 'clear-media', 'dummy'],
+    ['oa-cache', 'list-articles', 'dummy'],
+    ['oa-cache', 'show-article', 'dummy',
+        'Parasit_Vectors/Parasit_Vectors_2008_Sep_1_1_29.nxml'],
+    ['oa-cache', 'find-media', 'dummy'],
+    ['oa-cache', 'update-media', 'dummy'],
+    ['oa-cache', 'convert-media', 'dummy'],
+    ['oa-cache', 'convert-stats', 'dummy'],
+    ['oa-put'],
+    ['oa-pipeline']
+]
+
+def run(command, environment):
+    """
+    Returns wall clock seconds of one run of command and its exit status.
+    """
+    with open(devnull, 'w') as null:
+        start = time()
+        status = call([executable, path.join(ROOT, command[0])] + command[1:],
+            stdout=null, stderr=null, env=environment, cwd=ROOT)
+        return time() - start, status
+
+if __name__ == '__main__':
+    try:
+        runs = int(argv[1])
+    except IndexError:
+        runs = 10
+
+    home = mkdtemp()
+    environment = dict(environ,
+        XDG_CACHE_HOME=path.join(home, 'cache'),
+        XDG_CONFIG_HOME=path.join(home, 'config'),
+        XDG_DATA_HOME=path.join(home, 'data')
+    )
+    try:
+        stdout.write('%-70s %6s %9s %9s\n' % ('command', 'status',
+            'min ms', 'median ms'))
+        for command in COMMANDS:
+            results = [run(command, environment) for i in range(runs)]
+            timings = sorted(seconds for seconds, status in results)
+            stdout.write('%-70s %6d %9.1f %9.1f\n' % (
+                ' '.join(command)[:70],
+                results[-1][1],
+                timings[0] * 1000,
+                timings[len(timings) // 2] * 1000
+            ))
+    finally:
+        rmtree(home)
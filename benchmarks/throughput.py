@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures how many articles per second the pmc source lists, how fast
+find-media stores them, how fast CSV rows are written and how fast license
+statements are resolved, on synthetic corpora written by corpus.py. Every
+benchmark runs in its own process so its peak resident set size can be
+recorded. Results are appended to a JSON lines file and compared with the
+previous result of the same benchmark, so regressions stand out.
+
+Corpora are generated once and kept in the corpus directory; writing the
+one with a million articles takes hours.
+
+usage:  benchmarks/throughput.py [--sizes N,N,…] [--workers N]
+            [--corpus DIRECTORY] [--output FILE]
+"""
+
+import random
+
+from datetime import datetime
+from getopt import gnu_getopt, GetoptError
+from multiprocessing import Pipe, Process
+from os import devnull, path
+from resource import getrusage, RUSAGE_CHILDREN, RUSAGE_SELF
+from shutil import rmtree
+from subprocess import PIPE, Popen
+from sys import argv, exit, path as sys_path, stderr, stdout
+from tempfile import gettempdir, mkdtemp
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys_path.insert(0, ROOT)
+
+import corpus
+from helpers import export, stats
+from helpers.licenses import LicenseResolver
+from helpers.state import State
+from sources import pmc
+
+SIZES = [10000, 100000, 1000000]
+
+# marks a corpus directory whose archives were written completely
+COMPLETE_FILENAME = 'complete'
+
+def get_corpus(directory, articles):
+    """
+    Returns the directory of a corpus with the given number of articles,
+    writing it first if it does not exist.
+    """
+    corpus_path = path.join(directory, str(articles))
+    if not path.isfile(path.join(corpus_path, COMPLETE_FILENAME)):
+        stderr.write("Writing %d synthetic articles into “%s” …\n" % \
+            (articles, corpus_path))
+        corpus.generate(corpus_path, articles)
+        open(path.join(corpus_path, COMPLETE_FILENAME), 'w').close()
+    return corpus_path
+
+def list_articles(corpus_path, workers):
+    """
+    Lists all articles without supplementary materials, like the
+    list-articles action does, and writes them as CSV rows to /dev/null.
+    Returns the number of articles and the time spent writing rows.
+    """
+    count = 0
+    writing = 0.0
+    with open(devnull, 'w') as f:
+        writer = export.Writer(f)
+        for result in pmc.list_articles(corpus_path, workers=workers):
+            stopwatch = stats.Stopwatch()
+            writer.write(result)
+            writing += stopwatch.read()[0]
+            count += 1
+        stopwatch = stats.Stopwatch()
+        writer.close()
+        writing += stopwatch.read()[0]
+    return {'items': count, 'csv-wall': writing}
+
+def find_media(corpus_path, workers):
+    """
+    Lists all articles with supplementary materials, like the find-media
+    action does, and stores them in a new state database. Returns the
+    number of articles and the time spent storing them.
+    """
+    directory = mkdtemp()
+    count = 0
+    writing = 0.0
+    try:
+        state = State(directory)
+        for result in pmc.list_articles(corpus_path,
+            supplementary_materials=True, workers=workers, prefilter=True,
+            prefilter_check=100):
+            stopwatch = stats.Stopwatch()
+            state.add_article(result)
+            writing += stopwatch.read()[0]
+            count += 1
+        stopwatch = stats.Stopwatch()
+        state.close()
+        writing += stopwatch.read()[0]
+    finally:
+        rmtree(directory)
+    return {'items': count, 'db-wall': writing}
+
+def resolve_licenses(articles, workers):
+    """
+    Resolves one plain text license statement per article, drawn like the
+    statements in synthetic corpora, with a new resolver. Only resolving is
+    timed.
+    """
+    rng = random.Random(1)
+    resolver = LicenseResolver(pmc.license_url_equivalents)
+    resolving = 0.0
+    for start in range(0, articles, 10000):
+        statements = [
+            corpus._license_statement(rng, 0.02, 1000000 + number)
+            for number in range(start, min(start + 10000, articles))
+        ]
+        stopwatch = stats.Stopwatch()
+        for statement in statements:
+            resolver.resolve(statement)
+        resolving += stopwatch.read()[0]
+    return {'items': articles, 'resolve-wall': resolving}
+
+BENCHMARKS = [
+    ('list-articles', list_articles),
+    ('find-media', find_media),
+    ('licenses', resolve_licenses)
+]
+
+def _run(function, argument, workers, connection):
+    stopwatch = stats.Stopwatch()
+    result = function(argument, workers)
+    result['wall'], result['cpu'] = stopwatch.read()
+    # kilobytes on Linux; worker processes have been joined at this point
+    result['peak-rss'] = max(getrusage(RUSAGE_SELF).ru_maxrss,
+        getrusage(RUSAGE_CHILDREN).ru_maxrss)
+    connection.send(result)
+    connection.close()
+
+def run(function, argument, workers):
+    """
+    Runs a benchmark function in a new process and returns its result,
+    with wall clock and CPU seconds and peak RSS in kilobytes added.
+    """
+    receiver, sender = Pipe(False)
+    process = Process(target=_run, args=(function, argument, workers, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    finally:
+        process.join()
+    return result
+
+def get_revision():
+    """
+    Returns the commit the working tree is at, or None.
+    """
+    try:
+        output = Popen(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stdout=PIPE, stderr=PIPE).communicate()[0]
+    except OSError:  # git is not installed
+        return None
+    return output.strip() or None
+
+def get_previous(filename):
+    """
+    Returns the latest earlier record of every benchmark, size and number
+    of workers.
+    """
+    previous = {}
+    try:
+        for record in stats.read_records(filename):
+            key = (record['benchmark'], record['articles'], record['workers'])
+            previous[key] = record
+    except IOError:  # file does not exist
+        pass
+    return previous
+
+if __name__ == '__main__':
+    try:
+        options, arguments = gnu_getopt(argv[1:], '', ['sizes=', 'workers=',
+            'corpus=', 'output='])
+        options = dict(options)
+        sizes = SIZES
+        if '--sizes' in options:
+            sizes = [int(size) for size in options['--sizes'].split(',')]
+        workers = int(options.get('--workers', 1))
+        corpus_directory = options.get('--corpus',
+            path.join(gettempdir(), 'oa-benchmark-corpus'))
+        output = options.get('--output',
+            path.join(corpus_directory, 'throughput.jsonl'))
+    except (GetoptError, ValueError), e:  # invalid option or option value
+        stderr.write('Invalid option: %s\n' % str(e))
+        exit(1)
+
+    previous = get_previous(output)
+    revision = get_revision()
+    stdout.write('%-14s %8s %10s %12s %12s %10s %8s\n' % ('benchmark',
+        'articles', 'seconds', 'articles/s', 'writes/s', 'peak MB', 'change'))
+    for articles in sizes:
+        corpus_path = get_corpus(corpus_directory, articles)
+        for name, function in BENCHMARKS:
+            argument = articles if name == 'licenses' else corpus_path
+            result = run(function, argument, workers)
+            record = {
+                'benchmark': name,
+                'articles': articles,
+                'workers': workers,
+                'revision': revision,
+                'date': datetime.utcnow().isoformat(),
+                'seconds': result['wall'],
+                'cpu-seconds': result['cpu'],
+                'peak-rss': result['peak-rss'],
+                'rate': result['items'] / result['wall']
+            }
+            # the part of the time spent writing or resolving, as its own rate
+            for key in ['csv-wall', 'db-wall', 'resolve-wall']:
+                if key in result:
+                    record['write-rate'] = result['items'] / result[key] \
+                        if result[key] else None
+            if name == 'licenses':
+                record['rate'] = record.pop('write-rate')
+
+            change = ''
+            key = (name, articles, workers)
+            if key in previous and previous[key]['rate']:
+                change = '%+.1f%%' % \
+                    (100.0 * record['rate'] / previous[key]['rate'] - 100)
+            stats.append_record(output, record)
+            stdout.write('%-14s %8d %10.2f %12.1f %12s %10.1f %8s\n' % (
+                name,
+                articles,
+                record['seconds'],
+                record['rate'],
+                '%.1f' % record['write-rate'] \
+                    if record.get('write-rate') else '-',
+                record['peak-rss'] / 1024.0,
+                change
+            ))
+            stdout.flush()
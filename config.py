@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import errno
+
 from os import makedirs, path
 from sys import stderr, exit
 from xdg import BaseDirectory
@@ -11,12 +13,21 @@ cache_path = path.join(BaseDirectory.xdg_cache_home, APPLICATION_NAME)
 config_path = path.join(BaseDirectory.xdg_config_home, APPLICATION_NAME)
 data_path = path.join(BaseDirectory.xdg_data_home, APPLICATION_NAME)
 
+# Directories are created and the user configuration is read only when they
+# are first used, so that importing this module has no side effects and
+# commands that do not need the wiki work without credentials.
+
 def ensure_directory_exists(directory):
     if not path.exists(directory):
-        makedirs(directory)
+        try:
+            makedirs(directory)
+        except OSError, e:  # created by another process in the meantime
+            if e.errno != errno.EEXIST:
+                raise
 
-for p in (cache_path, config_path, data_path):
-    ensure_directory_exists(p)
+def get_cache_path():
+    ensure_directory_exists(cache_path)
+    return cache_path
 
 _metadata_path = path.join(cache_path, 'metadata')
 
@@ -58,13 +69,16 @@ free_license_urls = [
 
 USERCONFIG_FILENAME = "userconfig"
 userconfig_file = path.join(config_path, USERCONFIG_FILENAME)
-userconfig = RawConfigParser()
-userconfig.optionsxform = str  # case sensitivity
-userconfig.read(userconfig_file)
+_userconfig = None
 
 def get_userconfig(section, option):
+    global _userconfig
+    if _userconfig is None:
+        _userconfig = RawConfigParser()
+        _userconfig.optionsxform = str  # case sensitivity
+        _userconfig.read(userconfig_file)
     try:
-        return userconfig.get(section, option)
+        return _userconfig.get(section, option)
     except NoSectionError:
         stderr.write("“%s” does not contain a “%s” section.\n" % \
                          (userconfig_file, section))
@@ -74,6 +88,12 @@ def get_userconfig(section, option):
                          (userconfig_file, option))
         exit(127)
 
-api_url = get_userconfig('wiki', 'api_url')
-username = get_userconfig('wiki', 'username')
-password = get_userconfig('wiki', 'password')
+def get_wiki_config():
+    """
+    Returns API URL, username and password of the wiki to upload to.
+    """
+    return (
+        get_userconfig('wiki', 'api_url'),
+        get_userconfig('wiki', 'username'),
+        get_userconfig('wiki', 'password')
+    )
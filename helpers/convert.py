@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from multiprocessing import current_process, Pipe, Pool, Process
+from os import path, remove
+from shutil import copyfile
+from sys import exit, stderr
+from time import sleep, time
+from traceback import print_exc
+
+from helpers.stats import Stopwatch
+
+# Per-file conversion statistics are appended to this file as JSON lines.
+STATS_FILENAME = 'convert_stats.jsonl'
+
+# Container and stream formats that need no conversion. Streams of these
+# formats are copied into Ogg by helpers.media as they are.
+OGG_CONTAINER = 'application/ogg'
+PASSTHROUGH_CODECS = {
+    'audio': 'audio/x-vorbis',
+    'video': 'video/x-theora'
+}
+
+def plan(info):
+    """
+    Given a probe result, returns how a media file is to be converted:
+
+      'skip'             already Ogg Theora (+Vorbis), copied as is
+      'remux'            Theora and Vorbis in another container, copied into Ogg
+      'transcode-audio'  Theora video copied, audio encoded to Vorbis
+      'transcode-video'  Vorbis audio copied, video encoded to Theora
+      'transcode'        everything encoded
+
+    Without a probe result, everything is encoded.
+    """
+    if info is None or not info['video']:
+        return 'transcode'
+    compatible = {}
+    for kind in ('audio', 'video'):
+        compatible[kind] = all(
+            stream['codec'] == PASSTHROUGH_CODECS[kind]
+            for stream in info[kind]
+        )
+    if compatible['audio'] and compatible['video']:
+        if info['container'] == OGG_CONTAINER:
+            return 'skip'
+        return 'remux'
+    if compatible['video']:
+        return 'transcode-audio'
+    if compatible['audio'] and info['audio']:
+        return 'transcode-video'
+    return 'transcode'
+
+def make_job(row, source, target):
+    """
+    Returns a conversion job for a downloaded material, given as a row of
+    the state database, with tags taken from the material and its article.
+    """
+    return {
+        'url': row['url'],
+        'source': source,
+        'target': target,
+        'temporary': target + '.part',
+        'tags': {
+            'TITLE': (row['label'] or '').decode('utf-8'),
+            'ALBUM': (row['title'] or '').decode('utf-8'),  # article title
+            'ARTIST': (row['authors'] or '').decode('utf-8'),
+            'COPYRIGHTS': (row['copyright_holder'] or '').decode('utf-8'),
+            'LICENSE': (row['license_url'] or '').decode('utf-8'),
+            'DESCRIPTION': (row['caption'] or '').decode('utf-8'),
+            'DATE': (row['date'] or '').decode('utf-8')
+        }
+    }
+
+def convert(job, show_progress=True):
+    """
+    Converts the media file job['source'] to Ogg Theora, tagged with the
+    Vorbis comments in job['tags'], and saves it as job['temporary']. If
+    job['probe'] holds a probe result, streams are not searched again and
+    compatible streams are not encoded again, according to plan().
+
+    Returns a dictionary of wall and CPU seconds spent encoding and tagging.
+    """
+    # GStreamer and mutagen are only needed in the converting process.
+    import mutagen.oggtheora
+
+    timings = {}
+    stopwatch = Stopwatch()
+    method = plan(job.get('probe'))
+    if method == 'skip':
+        copyfile(job['source'], job['temporary'])
+    else:
+        from helpers import media
+        m = media.Media(job['source'])
+        if job.get('probe') is not None:
+            m.apply_probe(job['probe'])
+        else:
+            m.find_streams()
+        passthrough = {
+            'remux': ('audio', 'video'),
+            'transcode-audio': ('video',),
+            'transcode-video': ('audio',),
+            'transcode': ()
+        }[method]
+        m.convert(job['temporary'], show_progress, passthrough)
+    timings['encode-wall'], timings['encode-cpu'] = stopwatch.read()
+
+    stopwatch = Stopwatch()
+    try:
+        f = mutagen.oggtheora.OggTheora(job['temporary'])
+        for key, value in job['tags'].items():
+            f[key] = value
+        f.save()
+    except mutagen.oggtheora.OggTheoraHeaderError:
+        pass  # Most probably an encoding failure.
+    timings['tag-wall'], timings['tag-cpu'] = stopwatch.read()
+    return timings
+
+def _run(job, show_progress, connection):
+    """
+    Entry point of a converting process. The exit status tells the
+    scheduler whether the conversion succeeded; timings are sent back
+    through connection.
+    """
+    try:
+        connection.send(convert(job, show_progress))
+    except Exception:
+        print_exc()
+        exit(1)
+    exit(0)
+
+def _start(job, show_progress):
+    """
+    Starts converting a job in a new process.
+    """
+    receiver, sender = Pipe(False)
+    process = Process(target=_run, args=(job, show_progress, sender))
+    process.start()
+    sender.close()  # only the converting process writes
+    return process, job, receiver, time()
+
+def _finish(process, job, receiver, started):
+    """
+    Waits for a converting process to exit and collects its timings.
+    Returns None if the conversion succeeded, else a string describing the
+    error; the temporary file of a failed conversion is removed.
+    """
+    process.join()
+    try:
+        job['timings'] = receiver.recv()
+    except EOFError:  # conversion failed before sending timings
+        job['timings'] = {}
+    job['timings']['process-wall'] = time() - started
+    receiver.close()
+    if process.exitcode == 0:
+        return None
+    if process.exitcode < 0:
+        error = 'Conversion killed by signal %d.' % -process.exitcode
+    else:
+        error = 'Conversion failed with exit status %d.' % process.exitcode
+    try:
+        remove(job['temporary'])
+    except OSError:  # conversion did not create the file
+        pass
+    return error
+
+def _allow_children():
+    """
+    Initializer of pool processes, which multiprocessing makes daemonic and
+    so would not let start processes of their own.
+    """
+    current_process().daemon = False
+
+def make_pool(processes):
+    """
+    Returns a pool of processes for threads to probe and convert media in,
+    see convert_one() and probe.probe_many(). A process forked while other
+    threads run can deadlock on locks (of logging, SQLite or GStreamer) that
+    one of them held, so the pool has to be made before any threads are
+    started. Its processes run no threads and load no GStreamer; they start
+    a fresh process for every job, as convert_many() does.
+    """
+    return Pool(processes, _allow_children)
+
+def _convert_in_pool(job):
+    error = convert_one(job)
+    return error, job['timings']
+
+def convert_one(job, pool=None):
+    """
+    Converts a job in a separate process and waits for it to finish.
+    Returns None on success, else a string describing the error. If a pool
+    made by make_pool() is given, the process is started by one of its
+    processes.
+    """
+    if pool is not None:
+        error, job['timings'] = pool.apply(_convert_in_pool, (job,))
+        return error
+    return _finish(*_start(job, False))
+
+def convert_many(jobs, processes=1, key=None):
+    """
+    Converts jobs, which are dictionaries with 'source', 'temporary' and
+    'tags' keys, in up to processes separate processes at the same time.
+    Each conversion runs in a fresh process with its own GStreamer pipeline,
+    so a crashing conversion does not affect the others.
+
+    Jobs are started in descending order of key, by default the size of the
+    source file, so that the longest conversions do not start last. Yields a
+    (job, error) tuple as soon as each conversion finishes; error is None on
+    success, else a string describing it. The timings returned by convert()
+    are stored in job['timings'], together with the wall time of the whole
+    process as 'process-wall'.
+    """
+    if key is None:
+        key = lambda job: path.getsize(job['source'])
+    pending = sorted(jobs, key=key, reverse=True)
+    pending.reverse()  # pop() from the end
+    running = []
+    show_progress = (processes == 1)  # progress bars would be interleaved
+
+    while pending or running:
+        while pending and len(running) < processes:
+            running.append(_start(pending.pop(), show_progress))
+
+        finished = [r for r in running if not r[0].is_alive()]
+        if not finished:
+            sleep(0.1)
+            continue
+        for r in finished:
+            running.remove(r)
+            yield r[1], _finish(*r)
+
+def stats_record(job, error, probe_timing=(None, None),
+    rename_timing=(None, None)):
+    """
+    Returns a dictionary describing a finished conversion job, suitable for
+    appending to the statistics file: sizes, probed duration, wall and CPU
+    seconds per stage and the realtime factor of encoding.
+    """
+    record = {
+        'time': time(),
+        'url': job['url'],
+        'source': job['source'],
+        'method': job['method'],
+        'status': 'failed' if error else 'done',
+        'error': error,
+        'input-size': path.getsize(job['source']),
+        'output-size': None if error else path.getsize(job['target']),
+        'duration': (job['probe'] or {}).get('duration'),
+        # probes that were run are timed and failed ones have no result, so
+        # a result without timings was taken from the cache
+        'probe-cached': job['probe'] is not None and probe_timing[0] is None,
+        'probe-wall': probe_timing[0],
+        'probe-cpu': probe_timing[1],
+        'rename-wall': rename_timing[0],
+        'rename-cpu': rename_timing[1]
+    }
+    for key in ['encode-wall', 'encode-cpu', 'tag-wall', 'tag-cpu',
+        'process-wall']:
+        record[key] = job['timings'].get(key)
+    # media seconds converted per second of encoding
+    if record['duration'] and record['encode-wall']:
+        record['realtime-factor'] = record['duration'] / record['encode-wall']
+    else:
+        record['realtime-factor'] = None
+    return record
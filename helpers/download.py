@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from email.utils import mktime_tz, parsedate_tz
+from os import path, remove, rename, utime
+from collections import deque, OrderedDict
+from Queue import Queue
+from socket import error as SocketError
+from threading import Condition, Thread
+from time import sleep, time
+from urllib2 import urlopen, urlparse, Request, HTTPError, URLError
+
+BUFSIZE = 1024000  # (1024KB)
+USER_AGENT = 'oa-get/2012-05-31'
+
+class HeadRequest(Request):
+    def get_method(self):
+        return 'HEAD'
+
+def _get_last_modified(headers):
+    """
+    Returns the Last-Modified header as a timestamp, or None.
+    """
+    try:
+        return mktime_tz(parsedate_tz(headers['last-modified']))
+    except (KeyError, TypeError):  # header is missing or malformed
+        return None
+
+def _get_validator(headers):
+    """
+    Returns a string identifying the version of a remote file, or None.
+    """
+    return headers.get('etag') or headers.get('last-modified')
+
+def _is_current(local_filename, headers):
+    """
+    Returns True if a local file has the size given in the headers of a
+    response and is not older than the remote file.
+    """
+    try:
+        if path.getsize(local_filename) != int(headers['content-length']):
+            return False
+    except (OSError, KeyError, ValueError):  # local file or header missing
+        return False
+    last_modified = _get_last_modified(headers)
+    return last_modified is None or \
+        path.getmtime(local_filename) >= last_modified
+
+def _finish(part_filename, local_filename, headers):
+    """
+    Renames a complete partial download to local_filename and gives it
+    the modification time from the headers of a response.
+    """
+    rename(part_filename, local_filename)
+    remove(part_filename + '.validator')
+    last_modified = _get_last_modified(headers)
+    if last_modified is not None:
+        utime(local_filename, (last_modified, last_modified))
+
+def fetch(url, local_filename, bufsize=BUFSIZE):
+    """
+    Downloads url into local_filename, yielding completed and total bytes
+    (total is None if unknown) after every chunk, starting with the bytes
+    already present. Yields nothing if the local file is current.
+
+    Data is written to a “.part” file, which is renamed to local_filename
+    when the download is complete. An interrupted download is resumed if
+    the remote file did not change in between. A HEAD request decides
+    whether the local file is current, so no transfer is started for
+    files that are skipped.
+    """
+    try:
+        headers = urlopen(HeadRequest(url, None,
+            {'User-Agent' : USER_AGENT})).info()
+        if _is_current(local_filename, headers):
+            return
+        validator = _get_validator(headers)
+    except HTTPError:  # server does not support HEAD requests
+        headers = {}
+        validator = None
+
+    part_filename = local_filename + '.part'
+    validator_filename = part_filename + '.validator'
+    try:
+        with open(validator_filename, 'r') as validator_file:
+            part_validator = validator_file.read()
+        offset = path.getsize(part_filename)
+    except (IOError, OSError):  # no partial download
+        part_validator = None
+        offset = 0
+
+    try:
+        length = int(headers['content-length'])
+    except (KeyError, ValueError):  # size unknown
+        length = None
+    if offset and validator is not None and validator == part_validator:
+        if offset == length:
+            # An earlier run was interrupted after the last chunk was
+            # written, but before the partial download was renamed.
+            yield offset, length
+            _finish(part_filename, local_filename, headers)
+            return
+        if length is not None and offset > length:
+            offset = 0
+    else:
+        offset = 0
+
+    request_headers = {'User-Agent' : USER_AGENT}
+    if offset:
+        request_headers['Range'] = 'bytes=%d-' % offset
+        request_headers['If-Range'] = validator
+    try:
+        remote_file = urlopen(Request(url, None, request_headers))
+    except HTTPError as error:
+        if not offset or error.code != 416:  # Range Not Satisfiable
+            raise
+        # The partial download does not fit the remote file; start over.
+        del request_headers['Range'], request_headers['If-Range']
+        offset = 0
+        remote_file = urlopen(Request(url, None, request_headers))
+
+    if offset and remote_file.getcode() == 206:  # Partial Content
+        total = int(remote_file.headers['content-range'].split('/')[-1])
+        local_file = open(part_filename, 'ab')
+    else:
+        try:
+            total = int(remote_file.headers['content-length'])
+        except (KeyError, ValueError):  # size unknown
+            total = None
+        offset = 0
+        local_file = open(part_filename, 'wb')
+        with open(validator_filename, 'w') as validator_file:
+            validator_file.write(_get_validator(remote_file.headers) or '')
+
+    completed = offset
+    with local_file:
+        yield completed, total
+        while True:
+            chunk = remote_file.read(bufsize)
+            if chunk != '':
+                local_file.write(chunk)
+                completed += len(chunk)
+                yield completed, total
+            else:
+                break
+    remote_file.close()
+
+    if total is not None and completed != total:
+        raise IOError('Incomplete download of <%s>: %d of %d bytes.' % \
+            (url, completed, total))
+    _finish(part_filename, local_filename, remote_file.headers)
+
+def download(url, local_filename, progress=None):
+    """
+    Downloads url into local_filename, unless the local file is current.
+    Returns True if the file was downloaded, False if it was skipped.
+    If given, progress is called with url, completed and total bytes.
+    """
+    downloaded = False
+    for completed, total in fetch(url, local_filename):
+        downloaded = True
+        if progress is not None:
+            progress(url, completed, total)
+    return downloaded
+
+def _is_transient(error):
+    """
+    Returns True if a download that failed with error may succeed later.
+    """
+    if isinstance(error, HTTPError):
+        return error.code >= 500 or error.code == 429  # Too Many Requests
+    return isinstance(error, (URLError, SocketError, IOError))
+
+def download_with_retries(url, local_filename, retries=3, backoff=1.0,
+    progress=None):
+    """
+    Downloads url into local_filename, retrying transient failures with
+    exponential backoff.
+    """
+    attempt = 0
+    while True:
+        try:
+            return download(url, local_filename, progress)
+        except Exception, e:
+            if attempt >= retries or not _is_transient(e):
+                raise
+            sleep(backoff * 2 ** attempt)
+            attempt += 1
+
+def download_many(tasks, jobs=1, host_jobs=None, retries=3, backoff=1.0,
+    progress=None):
+    """
+    Downloads (url, local_filename) tasks using a pool of jobs threads, with
+    at most host_jobs concurrent downloads from any one host, by default as
+    many as there are threads. Yields a (url, local_filename, downloaded,
+    error) tuple as soon as each download finishes; error is None on
+    success, else a string describing it.
+    """
+    if host_jobs is None:
+        host_jobs = jobs
+    tasks = list(tasks)
+    result_queue = Queue()
+    # Tasks are queued per host, and a thread only takes a task from a host
+    # with a free slot, so no thread waits for a busy host while tasks for
+    # other hosts are left.
+    host_tasks = OrderedDict()
+    for url, local_filename in tasks:
+        host = urlparse.urlsplit(url).netloc
+        host_tasks.setdefault(host, deque()).append((url, local_filename))
+    host_downloads = dict((host, 0) for host in host_tasks)
+    condition = Condition()
+
+    def take():
+        """
+        Returns the next task of a host with a free slot, waiting until
+        there is one, or None when no tasks are left.
+        """
+        with condition:
+            while host_tasks:
+                for host, queue in host_tasks.items():
+                    if host_downloads[host] < host_jobs:
+                        host_downloads[host] += 1
+                        task = queue.popleft()
+                        if not queue:
+                            del host_tasks[host]
+                        return host, task
+                condition.wait()
+            return None
+
+    def work():
+        while True:
+            taken = take()
+            if taken is None:
+                return
+            host, (url, local_filename) = taken
+            try:
+                downloaded = download_with_retries(url, local_filename,
+                    retries, backoff, progress)
+                result_queue.put((url, local_filename, downloaded, None))
+            except Exception, e:
+                result_queue.put((url, local_filename, False, str(e)))
+            finally:
+                with condition:
+                    host_downloads[host] -= 1
+                    condition.notify_all()
+
+    threads = [Thread(target=work) for i in range(jobs)]
+    for thread in threads:
+        thread.daemon = True  # do not keep an interrupted run alive
+        thread.start()
+
+    for i in range(len(tasks)):
+        yield result_queue.get()
+
+# The state of a segmented download is kept next to its “.part” file: the
+# first line is the validator of the remote file, every other line start,
+# end and number of completed bytes of a segment.
+SEGMENTS_SUFFIX = '.segments'
+
+def _read_segments(segments_filename, validator, total):
+    """
+    Returns a list of [start, end, completed] lists from a segment state
+    file, or None if it does not exist or belongs to another remote file.
+    """
+    try:
+        with open(segments_filename, 'r') as segments_file:
+            if segments_file.readline().rstrip('\n') != validator:
+                return None
+            segments = [
+                [int(value) for value in line.split(',')]
+                for line in segments_file
+            ]
+    except (IOError, ValueError):  # no state or damaged state
+        return None
+    if not segments or segments[-1][1] != total - 1:
+        return None
+    return segments
+
+def _write_segments(segments_filename, validator, segments):
+    temporary_filename = segments_filename + '.tmp'
+    with open(temporary_filename, 'w') as segments_file:
+        segments_file.write(validator + '\n')
+        for segment in segments:
+            segments_file.write('%d,%d,%d\n' % tuple(segment))
+    rename(temporary_filename, segments_filename)
+
+def _fetch_segment(url, part_filename, validator, segment, messages,
+    bufsize, retries, backoff):
+    """
+    Downloads the remaining bytes of a segment into its place in the part
+    file, reporting progress to the messages queue. Runs in its own thread.
+    """
+    start, end = segment[0], segment[1]
+    attempt = 0
+    while True:
+        try:
+            if start + segment[2] > end:
+                break
+            request = Request(url, None, {
+                'User-Agent' : USER_AGENT,
+                'Range': 'bytes=%d-%d' % (start + segment[2], end),
+                'If-Range': validator
+            })
+            remote_file = urlopen(request)
+            if remote_file.getcode() != 206:
+                raise IOError('Server ignored range request for <%s>.' % url)
+            with open(part_filename, 'r+b') as local_file:
+                local_file.seek(start + segment[2])
+                while start + segment[2] <= end:
+                    chunk = remote_file.read(
+                        min(bufsize, end + 1 - start - segment[2]))
+                    if chunk == '':
+                        raise IOError('Connection closed while downloading <%s>.' % url)
+                    local_file.write(chunk)
+                    local_file.flush()
+                    segment[2] += len(chunk)
+                    messages.put(('progress', len(chunk)))
+            remote_file.close()
+            break
+        except Exception, e:
+            if attempt >= retries or not _is_transient(e):
+                messages.put(('error', e))
+                return
+            sleep(backoff * 2 ** attempt)
+            attempt += 1
+    messages.put(('done', None))
+
+def fetch_segmented(tasks, segments=4, bufsize=BUFSIZE, retries=3,
+    backoff=1.0, checkpoint_interval=1.0):
+    """
+    Downloads (url, local_filename) tasks at the same time, splitting every
+    file into byte range segments that are downloaded concurrently and
+    written into a preallocated “.part” file. Yields completed and total
+    bytes over all files as data arrives.
+
+    Segment progress is saved regularly, so an interrupted download resumes
+    every segment where it stopped. Files that are current are skipped;
+    servers that do not support range requests get a single connection.
+    Raises the first error that persisted through all retries, after the
+    remaining segments have finished.
+    """
+    messages = Queue()
+    threads = []
+    files = []  # (url, local_filename, part_filename, validator, segments)
+    plain_tasks = []
+
+    for url, local_filename in tasks:
+        headers = urlopen(HeadRequest(url, None,
+            {'User-Agent' : USER_AGENT})).info()
+        if _is_current(local_filename, headers):
+            continue
+        validator = _get_validator(headers)
+        try:
+            total = int(headers['content-length'])
+        except (KeyError, ValueError):  # size unknown
+            total = None
+        if headers.get('accept-ranges') != 'bytes' or validator is None or \
+            not total:
+            plain_tasks.append((url, local_filename, total))
+            continue
+
+        part_filename = local_filename + '.part'
+        segments_filename = part_filename + SEGMENTS_SUFFIX
+        file_segments = _read_segments(segments_filename, validator, total)
+        if file_segments is None or not path.exists(part_filename):
+            size = -(-total // segments)  # rounded up
+            file_segments = [
+                [start, min(start + size, total) - 1, 0]
+                for start in range(0, total, size)
+            ]
+            with open(part_filename, 'wb') as part_file:
+                part_file.truncate(total)  # preallocate
+            _write_segments(segments_filename, validator, file_segments)
+        files.append((url, local_filename, part_filename, validator,
+            file_segments, headers))
+
+    def fetch_plain(url, local_filename):
+        try:
+            last = 0
+            for completed, total in fetch(url, local_filename, bufsize):
+                messages.put(('progress', completed - last))
+                last = completed
+        except Exception, e:
+            messages.put(('error', e))
+            return
+        messages.put(('done', None))
+
+    total = 0
+    completed = 0
+    for url, local_filename, part_filename, validator, file_segments, \
+        headers in files:
+        for segment in file_segments:
+            total += segment[1] + 1 - segment[0]
+            completed += segment[2]
+            threads.append(Thread(target=_fetch_segment, args=(url,
+                part_filename, validator, segment, messages, bufsize,
+                retries, backoff)))
+    for url, local_filename, size in plain_tasks:
+        total += size or 0
+        threads.append(Thread(target=fetch_plain,
+            args=(url, local_filename)))
+
+    for thread in threads:
+        thread.daemon = True  # do not keep an interrupted run alive
+        thread.start()
+
+    def checkpoint():
+        for url, local_filename, part_filename, validator, file_segments, \
+            headers in files:
+            _write_segments(part_filename + SEGMENTS_SUFFIX, validator,
+                file_segments)
+
+    yield completed, total
+    error = None
+    running = len(threads)
+    last_checkpoint = time()
+    while running:
+        kind, value = messages.get()
+        if kind == 'progress':
+            completed += value
+            yield completed, total
+        elif kind == 'error':
+            error = error or value
+            running -= 1
+        else:
+            running -= 1
+        if time() - last_checkpoint > checkpoint_interval:
+            checkpoint()
+            last_checkpoint = time()
+    checkpoint()
+
+    for url, local_filename, part_filename, validator, file_segments, \
+        headers in files:
+        if [s for s in file_segments if s[0] + s[2] <= s[1]]:
+            continue  # incomplete, resume later
+        rename(part_filename, local_filename)
+        remove(part_filename + SEGMENTS_SUFFIX)
+        last_modified = _get_last_modified(headers)
+        if last_modified is not None:
+            utime(local_filename, (last_modified, last_modified))
+    if error is not None:
+        raise error
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+
+from cStringIO import StringIO
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+from os import path
+
+FORMATS = ['csv', 'jsonl', 'tsv']
+
+# Fields of an Article that can be exported, in the order of the columns.
+FIELDS = ['name', 'authors', 'title', 'abstract', 'journal_title', 'date',
+    'url', 'license_url', 'copyright_holder']
+
+DEFAULT_FIELDS = FIELDS[1:]
+
+# CSV headers are categories based on:
+# “Citation Rules with Examples for Journal Articles on the Internet”
+# <http://www.ncbi.nlm.nih.gov/books/NBK7281/#A55596>
+CSV_HEADERS = {
+    'name': 'Name',
+    'authors': 'Authors',
+    'title': 'Article Title',
+    'abstract': 'Article Abstract',  # not part of citation rules, but useful
+    'journal_title': 'Journal Title',
+    'date': 'Date of Publication',
+    'url': 'Available from',
+    'license_url': 'License',  # also not part of citation rules
+    'copyright_holder': 'Copyright Holder'  # same here
+}
+
+# Rows are collected and written to the output this many at a time.
+BATCH_SIZE = 1000
+
+# Characters that cannot appear in TSV fields, as they are escaped.
+TSV_ESCAPES = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
+def parse_fields(value):
+    """
+    Returns a list of fields from a comma-separated string. Raises
+    ValueError for unknown fields.
+    """
+    fields = value.split(',')
+    for field in fields:
+        if field not in FIELDS:
+            raise ValueError('unknown field “%s”, fields are %s' % \
+                (field, ', '.join(FIELDS)))
+    return fields
+
+def open_output(filename):
+    """
+    Opens a file for writing, compressed with gzip if the filename ends in
+    “.gz” or with bzip2 if it ends in “.bz2”.
+    """
+    extension = path.splitext(filename)[1]
+    if extension == '.gz':
+        import gzip
+        return gzip.open(filename, 'wb', 6)  # level 9 is much slower
+    if extension == '.bz2':
+        import bz2
+        return bz2.BZ2File(filename, 'w')
+    return open(filename, 'wb')
+
+def _text(value):
+    if value is None:
+        return ''
+    return value.encode('utf-8')
+
+def _tsv_text(value):
+    if value is None:
+        return ''
+    value = value.encode('utf-8')
+    for character, escape in TSV_ESCAPES:
+        if character in value:
+            value = value.replace(character, escape)
+    return value
+
+def _json_text(value):
+    if value is None:
+        return 'null'
+    return encode_basestring_ascii(value)
+
+class Writer():
+    """
+    Writes Article objects to a file as CSV, JSON lines or TSV, with the
+    given fields as columns or keys. Missing fields are empty in CSV and TSV
+    and null in JSON. TSV fields have backslashes, tabs and line breaks
+    escaped as \\\\, \\t, \\n and \\r. Rows are written batch_size at a
+    time; close() writes the rest, but does not close the file.
+    """
+    def __init__(self, f, format='csv', fields=DEFAULT_FIELDS,
+        batch_size=BATCH_SIZE):
+        if format not in FORMATS:
+            raise ValueError('unknown format “%s”, formats are %s' % \
+                (format, ', '.join(FORMATS)))
+        self.f = f
+        self.format = format
+        self.fields = fields
+        self.batch_size = batch_size
+        self.get_values = attrgetter(*fields)
+        if len(fields) == 1:  # attrgetter returns a single value
+            self.get_values = lambda article: (getattr(article, fields[0]),)
+        self.keys = ['"%s":' % field for field in fields]
+        self.rows = 0
+        self._new_batch()
+
+    def _new_batch(self):
+        self.batch = StringIO()
+        self.batch_rows = 0
+        if self.format == 'csv':
+            self.csv_writer = csv.writer(self.batch)
+
+    def write_header(self):
+        """
+        Writes column names; JSON lines have none.
+        """
+        if self.format == 'csv':
+            self.csv_writer.writerow([CSV_HEADERS[field] for field in
+                self.fields])
+        elif self.format == 'tsv':
+            self.batch.write('\t'.join(self.fields) + '\n')
+
+    def write(self, article):
+        values = self.get_values(article)
+        if self.format == 'csv':
+            self.csv_writer.writerow([_text(value) for value in values])
+        elif self.format == 'tsv':
+            self.batch.write('\t'.join([_tsv_text(value) for value in
+                values]) + '\n')
+        else:
+            self.batch.write('{' + ','.join([key + _json_text(value) for
+                key, value in zip(self.keys, values)]) + '}\n')
+        self.rows += 1
+        self.batch_rows += 1
+        if self.batch_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.f.write(self.batch.getvalue())
+        self._new_batch()
+
+    def close(self):
+        self.flush()
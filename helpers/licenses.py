@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+# Creative Commons license URLs embedded in license statements, for example
+# “http://creativecommons.org/licenses/by-nc/2.0/uk/”.
+_cc_url = re.compile(
+    r'https?://creativecommons\.org/licenses/[a-z-]+/\d\.\d(?:/[a-z]{2})?/?'
+)
+_markup = re.compile(r'</?url>')
+_whitespace = re.compile(r'\s+')
+_space_around_punctuation = re.compile(r' ?([()\[\],.;:]) ?')
+
+def normalise(statement):
+    """
+    Returns a license statement with markup removed, whitespace collapsed,
+    spaces around punctuation removed and converted to lower case, so that
+    statements differing only in these respects compare equal.
+    """
+    statement = _markup.sub(' ', statement)
+    statement = _whitespace.sub(' ', statement).strip().lower()
+    statement = _space_around_punctuation.sub(r'\1', statement)
+    return statement.rstrip('.')
+
+class LicenseResolver():
+    """
+    Maps plain text license statements to license URLs.
+
+    A statement is looked up among the known statements as is, then in an
+    index of normalised known statements; if it is not found there, an
+    embedded Creative Commons license URL is used. Results are memoised per
+    distinct statement. Statements that cannot be resolved are counted in
+    unknown, hits and misses of the memo in counts.
+    """
+    def __init__(self, equivalents):
+        self.equivalents = equivalents
+        self.index = {}
+        for statement, url in sorted(equivalents.items()):
+            self.index.setdefault(normalise(statement), url)
+        self.cache = {}
+        self.unknown = {}
+        self.counts = {'license-cache-hits': 0, 'license-cache-misses': 0}
+
+    def resolve(self, statement):
+        """
+        Returns the license URL for a statement, or None if it is unknown.
+        """
+        try:
+            url = self.cache[statement]
+            self.counts['license-cache-hits'] += 1
+        except KeyError:
+            self.counts['license-cache-misses'] += 1
+            url = self.equivalents.get(statement)
+            if url is None:
+                url = self.index.get(normalise(statement))
+            if url is None:
+                match = _cc_url.search(statement)
+                if match is not None:
+                    url = match.group(0)
+            self.cache[statement] = url
+        if url is None:
+            self.unknown[statement] = self.unknown.get(statement, 0) + 1
+        return url
+
+    def pop_unknown(self):
+        """
+        Returns counts of unknown statements since the last call.
+        """
+        unknown = self.unknown
+        self.unknown = {}
+        return unknown
+
+    def pop_counts(self):
+        """
+        Returns memo hits and misses since the last call.
+        """
+        counts = self.counts
+        self.counts = dict.fromkeys(counts, 0)
+        return counts
+
+def merge_counts(counts, other):
+    """
+    Adds counts from dictionary other to dictionary counts.
+    """
+    for key, count in other.items():
+        counts[key] = counts.get(key, 0) + count
@@ -8,12 +8,24 @@ import progressbar
 
 from sys import stderr
 
+# Stream formats that can be put into an Ogg container without re-encoding;
+# shared with the planner, so that it never plans what cannot be done here.
+from helpers.convert import PASSTHROUGH_CODECS
+
 class Media():
     def __init__(self, filename):
         self.filename = filename
         self.has_audio = False
         self.has_video = False
 
+    def apply_probe(self, info):
+        """
+        Determines audio and video streams from a probe result, as returned
+        by helpers.probe.probe(), instead of prerolling the file.
+        """
+        self.has_audio = bool(info['audio'])
+        self.has_video = bool(info['video'])
+
     def find_streams(self):
         """
         Determines if media file has audio and / or video streams.
@@ -51,13 +63,19 @@ class Media():
         
         loop.run()
 
-    def convert(self, outfile):
+    def convert(self, outfile, show_progress=True, passthrough=()):
         """
         Converts media file to Ogg Theora or Ogg Theora+Vorbis.
+
+        Streams of the kinds given in passthrough ('audio', 'video') must
+        already be Vorbis or Theora; they are copied into the Ogg container
+        without being decoded and encoded again.
         """
         loop = gobject.MainLoop()
 
-        if self.has_video and self.has_audio:
+        if passthrough:
+            pipeline = self._get_passthrough_pipeline(passthrough)
+        elif self.has_video and self.has_audio:
             pipeline = gst.parse_launch("""
                 filesrc name=source ! decodebin2 name=decoder
                 decoder. ! queue ! theoraenc ! queue ! oggmux name=muxer
@@ -80,7 +98,8 @@ class Media():
         sink.set_property('location', outfile)
 
         report = pipeline.get_by_name('report')
-        report.set_property('silent', True)
+        if report is not None:
+            report.set_property('silent', True)
 
         bus = pipeline.get_bus()
         def on_message(bus, message):
@@ -117,8 +136,51 @@ class Media():
             except:
                 # progressbar fails on >100% progress
                 # fall back to pipeline reporting
-                report.set_property('silent', False)
+                if report is not None:
+                    report.set_property('silent', False)
             return True  # continue loop
 
-        gobject.timeout_add(100, update_progress)
+        if show_progress:
+            gobject.timeout_add(100, update_progress)
         loop.run()
+
+    def _get_passthrough_pipeline(self, passthrough):
+        """
+        Returns a pipeline that muxes Theora and Vorbis streams of the kinds
+        given in passthrough into Ogg as they are and encodes all others.
+        The decoder hands out such streams parsed rather than decoded.
+        """
+        raw_caps = ['video/x-raw-yuv', 'video/x-raw-rgb', 'audio/x-raw-int',
+            'audio/x-raw-float']
+        passthrough_caps = [PASSTHROUGH_CODECS[kind] for kind in passthrough]
+
+        pipeline = gst.parse_launch("""
+            filesrc name=source ! decodebin2 name=decoder
+            oggmux name=muxer ! filesink name=sink
+        """)
+        decoder = pipeline.get_by_name('decoder')
+        decoder.set_property('caps',
+            gst.Caps(';'.join(raw_caps + passthrough_caps)))
+        muxer = pipeline.get_by_name('muxer')
+
+        def on_pad_added(decoder, pad):
+            name = pad.get_caps()[0].get_name()
+            if name in passthrough_caps:
+                chain = ['queue']
+            elif name.startswith('video/x-raw'):
+                chain = ['queue', 'ffmpegcolorspace', 'theoraenc']
+            elif name.startswith('audio/x-raw'):
+                chain = ['queue', 'audioconvert', 'audioresample', 'vorbisenc']
+            else:
+                return  # neither audio nor video, e.g. subtitles
+            elements = [gst.element_factory_make(e) for e in chain]
+            pipeline.add(*elements)
+            if len(elements) > 1:
+                gst.element_link_many(*elements)
+            elements[-1].link(muxer)
+            for element in elements:
+                element.sync_state_with_parent()
+            pad.link(elements[0].get_pad('sink'))
+
+        decoder.connect('pad-added', on_pad_added)
+        return pipeline
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from os import getpid, path, rename
+from sys import stderr
+from time import time
+
+# Seconds between writes of the metrics file during a run.
+METRICS_INTERVAL = 10
+
+# Seconds between progress lines in quiet mode.
+PROGRESS_INTERVAL = 5
+
+class Metrics():
+    """
+    Counters and timers of a run. counters can be given to a source's
+    list_articles() as its statistics dictionary; numeric values in it are
+    exported, others are ignored. Counters named “…-seconds” are timers.
+
+    If a filename is given, the counters, the elapsed time and the rate of
+    every counter are written to it every METRICS_INTERVAL seconds during a
+    run and when it ends, in the Prometheus text format if the filename
+    ends in “.prom”, else as JSON.
+
+    If quiet is true, the caller should not write per-item progress; a line
+    summarising the counters is written every PROGRESS_INTERVAL seconds and
+    when the run ends instead.
+    """
+    def __init__(self, labels, filename=None, quiet=False):
+        import atexit
+        self.labels = labels
+        self.filename = filename
+        self.quiet = quiet
+        self.counters = {}
+        self.started = time()
+        self.next_write = self.started + METRICS_INTERVAL
+        self.next_progress = self.started + PROGRESS_INTERVAL
+        atexit.register(self.close)  # also on exit with an error status
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def tick(self):
+        """
+        Writes the metrics file and the progress line when they are due. This
+        is meant to be called once per item from loops.
+        """
+        now = time()
+        if self.filename is not None and now >= self.next_write:
+            self.write()
+            self.next_write = now + METRICS_INTERVAL
+        if self.quiet and now >= self.next_progress:
+            stderr.write(self.summary() + '\n')
+            self.next_progress = now + PROGRESS_INTERVAL
+
+    def snapshot(self):
+        """
+        Returns a dictionary of numeric counters, the elapsed seconds and
+        the rate per second of every counter that is not a timer.
+        """
+        elapsed = time() - self.started
+        result = {'elapsed-seconds': elapsed}
+        for name, value in self.counters.items():
+            if isinstance(value, bool) or \
+                not isinstance(value, (int, long, float)):
+                continue
+            result[name] = value
+            if not name.endswith('-seconds') and elapsed > 0:
+                result[name + '-per-second'] = value / elapsed
+        return result
+
+    def summary(self):
+        """
+        Returns a line for humans with counters and timers; rates are left
+        to the metrics file.
+        """
+        return ', '.join(
+            ('%.1f %s' if isinstance(value, float) else '%d %s') % \
+                (value, name)
+            for name, value in sorted(self.snapshot().items())
+            if not name.endswith('-per-second')
+        )
+
+    def write(self):
+        """
+        Replaces the metrics file, so readers never see a partial file.
+        """
+        snapshot = self.snapshot()
+        temporary_path = '%s.%d.tmp' % (self.filename, getpid())
+        with open(temporary_path, 'w') as f:
+            if path.splitext(self.filename)[1] == '.prom':
+                labels = ','.join('%s="%s"' % item
+                    for item in sorted(self.labels.items()))
+                for name, value in sorted(snapshot.items()):
+                    name = 'oa_' + name.replace('-', '_')
+                    f.write('# TYPE %s gauge\n%s{%s} %r\n' % \
+                        (name, name, labels, value))
+            else:
+                json.dump(dict(snapshot, labels=self.labels), f,
+                    sort_keys=True)
+                f.write('\n')
+        rename(temporary_path, self.filename)
+
+    def close(self):
+        if self.started is None:  # closed already
+            return
+        if self.filename is not None:
+            self.write()
+        if self.quiet:
+            stderr.write(self.summary() + '\n')
+        self.started = None
+
+def start_profile(filename):
+    """
+    Profiles the rest of the run in the current process with cProfile. The
+    statistics are written to filename on exit, for reading with pstats.
+    """
+    import atexit, cProfile
+    profile = cProfile.Profile()
+    atexit.register(profile.dump_stats, filename)  # stops profiling first
+    profile.enable()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from Queue import Empty, Queue
+from threading import Thread
+from traceback import format_exc
+
+class Pipeline():
+    """
+    Passes items through a sequence of stages connected by bounded queues.
+    Every stage has its own pool of worker threads calling the stage's
+    function on each item; a function returns an item for the next stage
+    or None. A full queue blocks whoever feeds it, so a slow stage holds
+    back the stages before it instead of letting work pile up in memory.
+
+    A stage with a batch_size greater than 1 is called with a list of up to
+    that many items, as many as are queued, and returns a list of items for
+    the next stage. It waits only for the first item of a batch, so items
+    are not held back when few arrive.
+
+    Results are reported as events, which are passed to the thread that
+    runs the pipeline, so that state can be recorded from a single thread.
+    """
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.stages = []
+        self.events = Queue()  # unbounded, so that workers never block on it
+
+    def add_stage(self, name, function, workers=1, batch_size=1):
+        self.stages.append({
+            'name': name,
+            'function': function,
+            'workers': workers,
+            'batch_size': batch_size,
+            'queue': Queue(self.queue_size),
+            'threads': []
+        })
+
+    def put(self, stage_number, item):
+        """
+        Queues an item for a stage, waiting while the queue is full.
+        """
+        self.stages[stage_number]['queue'].put(item)
+
+    def emit(self, event):
+        self.events.put(event)
+
+    def _take(self, stage):
+        """
+        Returns up to batch_size items from the queue of a stage, waiting
+        only for the first one, and whether the stop marker was taken.
+        """
+        items = []
+        item = stage['queue'].get()
+        while item is not None:
+            items.append(item)
+            if len(items) == stage['batch_size']:
+                return items, False
+            try:
+                item = stage['queue'].get_nowait()
+            except Empty:
+                return items, False
+        return items, True
+
+    def _work(self, stage_number):
+        stage = self.stages[stage_number]
+        stopped = False
+        while not stopped:
+            items, stopped = self._take(stage)
+            if not items:
+                continue
+            if stage['batch_size'] == 1:
+                items = items[0]  # called with the item itself
+            try:
+                if stage['batch_size'] == 1:
+                    results = [stage['function'](items)]
+                else:
+                    results = stage['function'](items)
+            except Exception:  # keep the worker alive for the next item
+                self.emit(('error', stage['name'], items, format_exc()))
+                continue
+            if stage_number + 1 < len(self.stages):
+                for result in results:
+                    if result is not None:
+                        self.put(stage_number + 1, result)
+
+    def _close(self, producer_thread):
+        """
+        Stops the stages in order once the producer is done, so every stage
+        finishes the items it was given before the next one is stopped.
+        """
+        producer_thread.join()
+        for stage in self.stages:
+            for thread in stage['threads']:
+                stage['queue'].put(None)  # one stop marker per thread
+            for thread in stage['threads']:
+                thread.join()
+        self.events.put(None)
+
+    def run(self, producer):
+        """
+        Starts all stages and calls producer, which feeds the pipeline using
+        put() and emit(), in a thread of its own. Yields events as they
+        arrive, until all items have passed through. Errors raised by a
+        stage function are reported as ('error', stage name, item,
+        traceback) events; the item is a list for stages that take batches.
+        """
+        for number, stage in enumerate(self.stages):
+            for i in range(stage['workers']):
+                thread = Thread(target=self._work, args=(number,))
+                thread.daemon = True  # do not keep an interrupted run alive
+                thread.start()
+                stage['threads'].append(thread)
+
+        def produce():
+            try:
+                producer()
+            except Exception:
+                self.emit(('error', 'producer', None, format_exc()))
+        producer_thread = Thread(target=produce)
+        producer_thread.daemon = True
+        producer_thread.start()
+        closer = Thread(target=self._close, args=(producer_thread,))
+        closer.daemon = True
+        closer.start()
+
+        while True:
+            try:
+                # a timeout keeps waiting interruptible by KeyboardInterrupt
+                event = self.events.get(True, 1)
+            except Empty:
+                continue
+            if event is None:
+                return
+            yield event
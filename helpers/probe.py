@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import sqlite3
+
+from hashlib import sha1
+from multiprocessing import Pool, TimeoutError
+from os import path, stat
+
+from helpers.stats import Stopwatch
+
+PROBE_CACHE_FILENAME = 'probe_cache.sqlite'
+
+# Only the beginning and the end of a file are hashed, which is enough to
+# recognise a file again without reading all of it.
+HASH_BLOCKSIZE = 1048576  # (1MiB)
+
+# Seconds after which probing a file is given up.
+PROBE_TIMEOUT = 30
+
+def probe(filename, timeout=PROBE_TIMEOUT):
+    """
+    Inspects a media file with GStreamer's discoverer, without decoding it.
+    Returns a dictionary containing container format, duration in seconds,
+    overall bitrate and lists of audio and video streams with their codecs
+    and properties.
+    """
+    import pygst
+    pygst.require("0.10")
+    import gst
+    from gst.pbutils import Discoverer
+    from urllib import pathname2url
+
+    discoverer = Discoverer(timeout * gst.SECOND)
+    info = discoverer.discover_uri('file://' +
+        pathname2url(path.abspath(filename)))
+
+    result = {
+        'container': None,
+        'duration': float(info.get_duration()) / gst.SECOND,
+        'bitrate': None,
+        'audio': [],
+        'video': []
+    }
+    if result['duration'] > 0:
+        result['bitrate'] = int(path.getsize(filename) * 8 / result['duration'])
+
+    for stream in info.get_stream_list():
+        kind = stream.get_stream_type_nick()
+        codec = stream.get_caps()[0].get_name()
+        if kind == 'container':
+            result['container'] = codec
+        elif kind == 'video':
+            result['video'].append({
+                'codec': codec,
+                'width': stream.get_width(),
+                'height': stream.get_height(),
+                'bitrate': stream.get_bitrate() or None
+            })
+        elif kind == 'audio':
+            result['audio'].append({
+                'codec': codec,
+                'channels': stream.get_channels(),
+                'rate': stream.get_sample_rate(),
+                'bitrate': stream.get_bitrate() or None
+            })
+    return result
+
+def _timed_probe(filename, timeout):
+    """
+    Returns the probe result for a file together with the wall and CPU
+    seconds spent probing it.
+    """
+    stopwatch = Stopwatch()
+    info = probe(filename, timeout)
+    wall, cpu = stopwatch.read()
+    return info, wall, cpu
+
+def fingerprint(filename):
+    """
+    Returns a SHA-1 hex digest of the first and last block of a file.
+    """
+    h = sha1()
+    with open(filename, 'rb') as f:
+        h.update(f.read(HASH_BLOCKSIZE))
+        f.seek(0, 2)
+        if f.tell() > HASH_BLOCKSIZE:
+            f.seek(-min(HASH_BLOCKSIZE, f.tell() - HASH_BLOCKSIZE), 2)
+            h.update(f.read(HASH_BLOCKSIZE))
+    return h.hexdigest()
+
+class ProbeCache():
+    """
+    Stores probe results keyed by file size, modification time and
+    fingerprint. A file is looked up by path first; only if it was moved or
+    its path does not match is its fingerprint computed. Hits and misses are
+    counted in counts.
+    """
+    def __init__(self, directory):
+        self.counts = {'probe-cache-hits': 0, 'probe-cache-misses': 0}
+        self.connection = sqlite3.connect(
+            path.join(directory, PROBE_CACHE_FILENAME))
+        self.connection.text_factory = str
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS probes (
+                size INTEGER,
+                mtime INTEGER,
+                hash TEXT,
+                path TEXT,
+                info TEXT,
+                PRIMARY KEY (size, mtime, hash)
+            );
+            CREATE INDEX IF NOT EXISTS probes_path ON probes (path);
+        """)
+
+    def get(self, filename):
+        """
+        Returns the cached probe result for a file, or None.
+        """
+        status = stat(filename)
+        size, mtime = status.st_size, int(status.st_mtime)
+        row = self.connection.execute(
+            'SELECT info FROM probes WHERE path = ? AND size = ? AND mtime = ?',
+            (filename, size, mtime)
+        ).fetchone()
+        if row is None:
+            row = self.connection.execute(
+                'SELECT info FROM probes WHERE size = ? AND hash = ?',
+                (size, fingerprint(filename))
+            ).fetchone()
+        if row is None:
+            self.counts['probe-cache-misses'] += 1
+            return None
+        self.counts['probe-cache-hits'] += 1
+        return json.loads(row[0])
+
+    def put(self, filename, info):
+        status = stat(filename)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO probes VALUES (?,?,?,?,?)', (
+                status.st_size,
+                int(status.st_mtime),
+                fingerprint(filename),
+                filename,
+                json.dumps(info)
+            )
+        )
+        self.connection.commit()
+
+def _probe_apart(filename, timeout):
+    """
+    Probes a file like _timed_probe() in a process of its own, which is
+    killed if it does not finish within timeout seconds. Processes of a
+    shared pool probe files this way, so they never load GStreamer.
+    """
+    pool = Pool(1)
+    try:
+        return pool.apply_async(_timed_probe, (filename, timeout)).get(
+            timeout + 5)
+    finally:
+        pool.terminate()
+        pool.join()
+
+def probe_many(filenames, cache, processes=1, timeout=PROBE_TIMEOUT,
+    timings=None, pool=None):
+    """
+    Returns a dictionary mapping filenames to probe results, taken from the
+    cache where possible. Other files are probed in a pool of processes, so
+    that GStreamer is not loaded into the calling process; files that cannot
+    be probed within timeout seconds map to None. If a pool made by
+    convert.make_pool() is given, files are probed by processes started by
+    its processes instead.
+
+    If timings is a dictionary, wall and CPU seconds spent probing are
+    stored in it for every file that was probed successfully.
+    """
+    results = {}
+    uncached = []
+    for filename in filenames:
+        results[filename] = cache.get(filename)
+        if results[filename] is None:
+            uncached.append(filename)
+    if not uncached:
+        return results
+
+    if pool is None:
+        probe_pool = Pool(processes)
+        function, deadline = _timed_probe, timeout + 5
+    else:
+        probe_pool = pool
+        function, deadline = _probe_apart, timeout + 10
+    try:
+        pending = [
+            (filename, probe_pool.apply_async(function, (filename, timeout)))
+            for filename in uncached
+        ]
+        for filename, result in pending:
+            try:
+                results[filename], wall, cpu = result.get(deadline)
+                cache.put(filename, results[filename])
+                if timings is not None:
+                    timings[filename] = (wall, cpu)
+            except TimeoutError:  # probing hangs or the process crashed
+                results[filename] = None
+            except Exception:  # file could not be probed
+                results[filename] = None
+    finally:
+        if pool is None:
+            probe_pool.terminate()
+            probe_pool.join()
+    return results
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Article information is kept in objects with slots instead of dictionaries,
+# as millions of them pass through list_articles(); this saves the memory of
+# a dictionary per article and material and keeps fields in a fixed order.
+
+class SupplementaryMaterial(object):
+    """
+    A supplementary material of an article. Fields are text or None.
+    """
+    __slots__ = ('url', 'label', 'caption', 'mimetype', 'mime_subtype')
+
+    def __init__(self, url, label, caption, mimetype, mime_subtype):
+        self.url = url
+        self.label = label
+        self.caption = caption
+        self.mimetype = mimetype
+        self.mime_subtype = mime_subtype
+
+    def __getstate__(self):  # objects with slots have no __dict__ to pickle
+        return (self.url, self.label, self.caption, self.mimetype,
+            self.mime_subtype)
+
+    def __setstate__(self, state):
+        self.url, self.label, self.caption, self.mimetype, \
+            self.mime_subtype = state
+
+    def db_row(self, article_name):
+        """
+        Returns the values of a row of the materials table.
+        """
+        return (self.url, article_name, self.label, self.caption,
+            self.mimetype, self.mime_subtype)
+
+class Article(object):
+    """
+    Information on an article, as yielded by a source's list_articles().
+    Fields are text or None. materials is a list of SupplementaryMaterial
+    objects, or None if supplementary materials were not listed.
+    """
+    __slots__ = ('name', 'authors', 'title', 'abstract', 'journal_title',
+        'date', 'url', 'license_url', 'copyright_holder', 'materials')
+
+    def __init__(self, name, authors=None, title=None, abstract=None,
+        journal_title=None, date=None, url=None, license_url=None,
+        copyright_holder=None, materials=None):
+        self.name = name
+        self.authors = authors
+        self.title = title
+        self.abstract = abstract
+        self.journal_title = journal_title
+        self.date = date
+        self.url = url
+        self.license_url = license_url
+        self.copyright_holder = copyright_holder
+        self.materials = materials
+
+    def __getstate__(self):
+        return (self.name, self.authors, self.title, self.abstract,
+            self.journal_title, self.date, self.url, self.license_url,
+            self.copyright_holder, self.materials)
+
+    def __setstate__(self, state):
+        self.name, self.authors, self.title, self.abstract, \
+            self.journal_title, self.date, self.url, self.license_url, \
+            self.copyright_holder, self.materials = state
+
+    def db_row(self):
+        """
+        Returns the values of a row of the articles table. Articles without
+        supplementary materials are recorded as failures.
+        """
+        return (self.name, 'success' if self.materials else 'fail',
+            self.authors, self.title, self.abstract, self.journal_title,
+            self.date, self.url, self.license_url, self.copyright_holder)
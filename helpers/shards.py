@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Work is divided among hosts by article: an article and its supplementary
+# materials belong to the shard given by the CRC-32 of the article name, so
+# every host assigns them alike, without coordination, and each shard can be
+# taken through all stages on its own.
+
+from zlib import crc32
+
+def parse_shard(value):
+    """
+    Returns a (k, n) tuple for the k-th of n shards, counted from 1, given
+    as “K/N”. Raises ValueError if it is malformed.
+    """
+    try:
+        k, n = [int(number) for number in value.split('/')]
+    except ValueError:
+        raise ValueError('shard “%s” is not of the form K/N' % value)
+    if not 1 <= k <= n:
+        raise ValueError('shard %d/%d does not exist' % (k, n))
+    return k, n
+
+def in_shard(name, shard):
+    """
+    Tells whether an article belongs to a shard. Every article belongs to
+    shard None.
+    """
+    if shard is None:
+        return True
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    k, n = shard
+    return (crc32(name) & 0xffffffff) % n == k - 1
+
+def shard_name(shard):
+    """
+    Returns “K-of-N”, for filenames of per-shard files.
+    """
+    return '%d-of-%d' % shard
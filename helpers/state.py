@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+# csv.field_size_limit must be reset according to
+# <http://lethain.com/handling-very-large-csv-and-xml-files-in-python/>
+csv.field_size_limit(999999999)
+
+import re
+import sqlite3
+
+from os import listdir, path
+from time import time
+
+from helpers.shards import in_shard, shard_name
+
+STATE_FILENAME = 'state.sqlite'
+
+# The state of a shard is kept apart from the canonical state, in a file
+# named after the shard, until it is merged; see State.merge().
+SHARD_FILENAME = 'state.%s.sqlite'
+SHARD_PATTERN = re.compile(r'^state\.(\d+)-of-(\d+)\.sqlite$')
+
+TABLES = ['articles', 'materials', 'downloads', 'conversions', 'uploads']
+
+# Key columns of the tables whose rows record when they were last modified.
+# Materials are always written together with their article.
+MODIFIED_TABLES = {
+    'articles': 'name',
+    'downloads': 'url',
+    'conversions': 'url',
+    'uploads': 'url'
+}
+
+# Number of articles written before changes are committed to disk.
+COMMIT_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    name TEXT PRIMARY KEY,
+    status TEXT NOT NULL,  -- 'success' if materials were found, else 'fail'
+    authors TEXT,
+    title TEXT,
+    abstract TEXT,
+    journal_title TEXT,
+    date TEXT,
+    url TEXT,
+    license_url TEXT,
+    copyright_holder TEXT,
+    modified REAL  -- see State.merge()
+);
+CREATE INDEX IF NOT EXISTS articles_status ON articles (status);
+
+-- the same file may be supplementary to several articles
+CREATE TABLE IF NOT EXISTS materials (
+    url TEXT NOT NULL,
+    article_name TEXT NOT NULL,
+    label TEXT,
+    caption TEXT,
+    mimetype TEXT,
+    mime_subtype TEXT,
+    PRIMARY KEY (article_name, url)
+);
+CREATE INDEX IF NOT EXISTS materials_url ON materials (url);
+
+CREATE TABLE IF NOT EXISTS downloads (
+    url TEXT PRIMARY KEY,
+    path TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    modified REAL
+);
+CREATE INDEX IF NOT EXISTS downloads_status ON downloads (status);
+
+CREATE TABLE IF NOT EXISTS conversions (
+    url TEXT PRIMARY KEY,
+    path TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    method TEXT,  -- 'skip', 'remux', 'transcode-audio', 'transcode-video' or 'transcode'
+    sha1 TEXT,  -- hex digest of the converted file
+    modified REAL
+);
+CREATE INDEX IF NOT EXISTS conversions_status ON conversions (status);
+
+CREATE TABLE IF NOT EXISTS uploads (
+    url TEXT PRIMARY KEY,
+    wiki_filename TEXT,
+    status TEXT NOT NULL,  -- 'done', 'failed' or 'partial'
+    error TEXT,
+    stash_key TEXT,  -- upload stash key and bytes stashed of a chunked upload
+    stash_offset INTEGER,
+    modified REAL
+);
+CREATE INDEX IF NOT EXISTS uploads_status ON uploads (status);
+"""
+
+# Downloads, conversions and uploads are per URL, so a material of several
+# articles is only listed with the first of them.
+FIRST_MATERIAL = """
+    materials.rowid = (SELECT MIN(rowid) FROM materials AS other
+        WHERE other.url = materials.url)
+"""
+
+ARTICLE_COLUMNS = """
+    articles.name, articles.authors, articles.title, articles.abstract,
+    articles.journal_title, articles.date, articles.url AS article_url,
+    articles.license_url, articles.copyright_holder,
+    materials.label, materials.caption, materials.mimetype,
+    materials.mime_subtype, materials.url
+"""
+
+def material_row(article, material):
+    """
+    Returns a dictionary with the keys of the rows returned by
+    State.materials_to_download() for a SupplementaryMaterial of an Article,
+    so that it can be processed before it is read back from the database.
+    Text is UTF-8 encoded.
+    """
+    def text(value):
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return value
+    return {
+        'name': text(article.name),
+        'authors': text(article.authors),
+        'title': text(article.title),
+        'abstract': text(article.abstract),
+        'journal_title': text(article.journal_title),
+        'date': text(article.date),
+        'article_url': text(article.url),
+        'license_url': text(article.license_url),
+        'copyright_holder': text(article.copyright_holder),
+        'label': text(material.label),
+        'caption': text(material.caption),
+        'mimetype': text(material.mimetype),
+        'mime_subtype': text(material.mime_subtype),
+        'url': text(material.url)
+    }
+
+class State():
+    """
+    Keeps track of the progress of a source through the import stages:
+    articles and their supplementary materials found in metadata, and
+    materials downloaded, converted and uploaded.
+
+    Text is returned as UTF-8 encoded strings, just like the CSV caches
+    this replaces.
+
+    If a (k, n) shard is given, the state of the articles of that shard and
+    their materials is kept in a file of its own. When it is created, it is
+    filled with their state from the canonical state file.
+
+    Rows are stamped with the time they were last modified, except rows
+    copied from the canonical state into a shard, so that merging the shard
+    copies only rows that changed in it.
+    """
+    def __init__(self, directory, shard=None):
+        if shard is None:
+            filename = path.join(directory, STATE_FILENAME)
+        else:
+            filename = path.join(directory, SHARD_FILENAME % shard_name(shard))
+        created = not path.exists(filename)
+        self.connection = sqlite3.connect(filename)
+        self.connection.text_factory = str
+        self.connection.row_factory = sqlite3.Row
+        # processes that start at once, like shards, must not create the
+        # same tables at the same time
+        self.connection.executescript('BEGIN EXCLUSIVE;' + SCHEMA + 'COMMIT;')
+        self.uncommitted = 0
+        if created and shard is None:
+            _import_csv_caches(self, directory)
+            self.commit()
+        elif created:
+            State(directory).close()  # creates it, if need be
+            self._import_shard(path.join(directory, STATE_FILENAME), shard)
+
+    def _attach(self, filename, database):
+        """
+        Attaches another state file and returns a dictionary mapping table
+        names to the columns that both databases have. Columns are looked
+        up first, as PRAGMA statements commit pending changes.
+        """
+        self.connection.execute('ATTACH DATABASE ? AS %s' % database,
+            (filename,))
+        def columns(database, table):
+            return [row[1] for row in self.connection.execute(
+                'PRAGMA %s.table_info(%s)' % (database, table))]
+        return dict(
+            (table, [column for column in columns('main', table)
+                if column in columns(database, table)])
+            for table in TABLES
+        )
+
+    def _copy_rows(self, database, table, columns, condition='1'):
+        """
+        Copies the given columns of rows of a table from an attached
+        database, replacing rows with the same key. Returns the number of
+        rows copied.
+        """
+        columns = ','.join(columns)
+        return self.connection.execute(
+            'INSERT OR REPLACE INTO main.%s (%s) SELECT %s FROM %s.%s WHERE %s' % \
+                (table, columns, columns, database, table, condition)
+        ).rowcount
+
+    def _import_shard(self, filename, shard):
+        """
+        Copies the state of the articles of a shard, their materials and
+        what was done with them from another state file, without the times
+        the rows were modified.
+        """
+        self.connection.create_function('in_shard', 1,
+            lambda name: in_shard(name, shard))
+        columns = self._attach(filename, 'canonical')
+        for table in columns:
+            if 'modified' in columns[table]:
+                columns[table].remove('modified')
+        self._copy_rows('canonical', 'articles', columns['articles'],
+            'in_shard(name)')
+        self._copy_rows('canonical', 'materials', columns['materials'],
+            'in_shard(article_name)')
+        for table in TABLES[2:]:
+            self._copy_rows('canonical', table, columns[table],
+                'url IN (SELECT url FROM main.materials)')
+        self.commit()
+        self.connection.execute('DETACH DATABASE canonical')
+
+    def merge(self, filename):
+        """
+        Merges another state file, usually that of a shard, into this state.
+        Only rows that were modified in it are merged, unless this state has
+        a more recent version of them: rows copied into a shard from the
+        canonical state are never merged back, so they cannot replace what
+        was recorded in the canonical state since. Merged rows replace rows
+        with the same key, and merged articles replace all materials of
+        articles with the same name. Returns a dictionary mapping table
+        names to numbers of rows merged.
+        """
+        self.commit()
+        columns = self._attach(filename, 'shard')
+        conditions = {}
+        for table, key in MODIFIED_TABLES.items():
+            if 'modified' not in columns[table]:  # all rows count as changed
+                conditions[table] = '1'
+                continue
+            conditions[table] = (
+                'shard.%(table)s.modified IS NOT NULL AND NOT EXISTS ('
+                'SELECT 1 FROM main.%(table)s AS newer '
+                'WHERE newer.%(key)s = shard.%(table)s.%(key)s '
+                'AND newer.modified > shard.%(table)s.modified)'
+            ) % {'table': table, 'key': key}
+        conditions['materials'] = \
+            'article_name IN (SELECT name FROM shard.articles WHERE %s)' % \
+                conditions['articles']
+        try:
+            self.connection.execute(
+                'DELETE FROM main.materials WHERE %s' % conditions['materials']
+            )
+            counts = dict(
+                (table, self._copy_rows('shard', table, columns[table],
+                    conditions[table]))
+                for table in TABLES
+            )
+            self.commit()
+        except:
+            self.connection.rollback()
+            raise
+        finally:
+            self.connection.execute('DETACH DATABASE shard')
+        return counts
+
+    def commit(self):
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def article_names(self):
+        """
+        Returns the set of names of all articles that have been examined.
+        """
+        cursor = self.connection.execute('SELECT name FROM articles')
+        return set(row[0] for row in cursor)
+
+    def add_article(self, article):
+        """
+        Stores an Article as yielded by a source's list_articles(). Articles
+        without supplementary materials are recorded as failures.
+        """
+        self.connection.execute(
+            'INSERT OR REPLACE INTO articles VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+            article.db_row() + (time(),)
+        )
+        self.connection.execute(
+            'DELETE FROM materials WHERE article_name = ?', (article.name,)
+        )
+        if article.materials:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO materials VALUES (?,?,?,?,?,?)',
+                [material.db_row(article.name) for material in
+                    article.materials]
+            )
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+    def clear_articles(self):
+        self.connection.execute('DELETE FROM materials')
+        self.connection.execute('DELETE FROM articles')
+        self.commit()
+
+    def clear_media(self):
+        self.connection.execute('DELETE FROM downloads')
+        self.connection.execute('DELETE FROM conversions')
+        self.commit()
+
+    def materials_to_download(self, mimetypes=None):
+        """
+        Returns supplementary materials that have not been downloaded yet,
+        together with the information on the article they belong to. If a
+        list of mimetypes is given, only materials of these are returned.
+        """
+        condition = ''
+        if mimetypes is not None:
+            condition = 'AND materials.mimetype IN (%s)' % \
+                ','.join('?' * len(mimetypes))
+        return self.connection.execute("""
+            SELECT %s FROM articles
+            JOIN materials ON materials.article_name = articles.name
+            LEFT JOIN downloads ON downloads.url = materials.url
+            WHERE articles.status = 'success'
+            AND (downloads.status IS NULL OR downloads.status != 'done')
+            AND %s %s
+            ORDER BY articles.rowid
+        """ % (ARTICLE_COLUMNS, FIRST_MATERIAL, condition),
+            mimetypes or []).fetchall()
+
+    def downloads_to_convert(self):
+        """
+        Returns downloaded supplementary materials that have not been
+        converted yet. The local filename is given as 'path'.
+        """
+        return self.connection.execute("""
+            SELECT %s, downloads.path FROM articles
+            JOIN materials ON materials.article_name = articles.name
+            JOIN downloads ON downloads.url = materials.url
+            LEFT JOIN conversions ON conversions.url = materials.url
+            WHERE downloads.status = 'done'
+            AND (conversions.status IS NULL OR conversions.status != 'done')
+            AND %s
+            ORDER BY downloads.rowid
+        """ % (ARTICLE_COLUMNS, FIRST_MATERIAL)).fetchall()
+
+    def conversions_to_upload(self):
+        """
+        Returns converted supplementary materials that have not been
+        uploaded yet. The local filename is given as 'path' and its SHA-1
+        as 'sha1', the state of an interrupted chunked upload as
+        'stash_key' and 'stash_offset'.
+        """
+        return self.connection.execute("""
+            SELECT %s, conversions.path, conversions.sha1, uploads.stash_key,
+            uploads.stash_offset FROM articles
+            JOIN materials ON materials.article_name = articles.name
+            JOIN conversions ON conversions.url = materials.url
+            LEFT JOIN uploads ON uploads.url = materials.url
+            WHERE conversions.status = 'done'
+            AND (uploads.status IS NULL OR uploads.status != 'done')
+            AND %s
+            ORDER BY conversions.rowid
+        """ % (ARTICLE_COLUMNS, FIRST_MATERIAL)).fetchall()
+
+    def record_download(self, url, filename, status='done', error=None):
+        self._record('downloads', url, filename, status, error)
+
+    def record_conversion(self, url, filename, status='done', error=None,
+        method=None, sha1=None):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO conversions VALUES (?,?,?,?,?,?,?)',
+            (url, filename, status, error, method, sha1, time())
+        )
+        self.commit()
+
+    def record_sha1(self, url, sha1):
+        """
+        Records the SHA-1 of a converted file that was converted before
+        digests were recorded.
+        """
+        self.connection.execute(
+            'UPDATE conversions SET sha1 = ?, modified = ? WHERE url = ?',
+            (sha1, time(), url)
+        )
+        self.commit()
+
+    def record_upload(self, url, wiki_filename, status='done', error=None,
+        stash_key=None, stash_offset=None):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO uploads VALUES (?,?,?,?,?,?,?)',
+            (url, wiki_filename, status, error, stash_key, stash_offset,
+            time())
+        )
+        self.commit()
+
+    def _record(self, table, url, value, status, error):
+        """
+        Records the outcome of a stage for a material and commits at once,
+        so that finished work survives an interrupted run.
+        """
+        self.connection.execute(
+            'INSERT OR REPLACE INTO %s VALUES (?,?,?,?,?)' % table,
+            (url, value, status, error, time())
+        )
+        self.commit()
+
+def shard_filenames(directory):
+    """
+    Returns a list of (filename, (k, n)) tuples of the shard state files in
+    a directory, ordered by shard.
+    """
+    shards = []
+    for filename in listdir(directory):
+        match = SHARD_PATTERN.match(filename)
+        if match is not None:
+            shard = (int(match.group(1)), int(match.group(2)))
+            shards.append((shard[::-1], path.join(directory, filename), shard))
+    return [(filename, shard) for key, filename, shard in sorted(shards)]
+
+def _import_csv_caches(state, directory):
+    """
+    Imports the CSV caches written by earlier versions, if they exist.
+
+    Rows of success_cache may lack fields, as empty values were omitted when
+    writing; such articles are not imported, so that they are examined again.
+    Earlier versions also wrote articles with materials to fail_cache, so
+    only articles without a row in success_cache are imported as failures.
+    Rows of download_cache and converted_cache end in material URL and
+    local filename, which is enough to restore download and conversion state.
+    """
+    def rows(filename):
+        try:
+            with open(path.join(directory, filename), 'r') as f:
+                for row in csv.reader(f):
+                    yield row
+        except IOError:  # file does not exist
+            return
+
+    successes = set()
+    incomplete = set()  # articles with a material row that lacks fields
+    for row in rows('success_cache'):
+        successes.add(row[0])
+        if len(row) != 14:
+            incomplete.add(row[0])
+
+    execute = state.connection.execute
+    for row in rows('fail_cache'):
+        if row[0] in successes:
+            continue
+        execute("INSERT OR IGNORE INTO articles (name, status) VALUES (?, 'fail')",
+            (row[0],))
+    for row in rows('success_cache'):
+        if row[0] in incomplete:
+            continue
+        execute("INSERT OR REPLACE INTO articles VALUES (?,'success',?,?,?,?,?,?,?,?,NULL)",
+            row[0:9])
+        execute('INSERT OR REPLACE INTO materials VALUES (?,?,?,?,?,?)',
+            (row[13], row[0], row[9], row[10], row[11], row[12]))
+    for row in rows('download_cache'):
+        execute("INSERT OR REPLACE INTO downloads VALUES (?, ?, 'done', NULL, NULL)",
+            row[-2:])
+    for row in rows('converted_cache'):
+        execute("INSERT OR REPLACE INTO conversions VALUES (?, ?, 'done', NULL, NULL, NULL, NULL)",
+            row[-2:])
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from resource import getrusage, RUSAGE_SELF
+from time import time
+
+class Stopwatch():
+    """
+    Measures wall clock time and CPU time of the current process, including
+    all of its threads, since it was created.
+    """
+    def __init__(self):
+        self.wall = time()
+        self.cpu = _cpu_time()
+
+    def read(self):
+        """
+        Returns elapsed wall and CPU seconds.
+        """
+        return time() - self.wall, _cpu_time() - self.cpu
+
+def _cpu_time():
+    usage = getrusage(RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def append_record(filename, record):
+    """
+    Appends a dictionary as a line of JSON to a file.
+    """
+    with open(filename, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+def read_records(filename):
+    """
+    Yields dictionaries from a file of JSON lines, skipping damaged lines
+    such as one cut off by an interrupted run.
+    """
+    with open(filename, 'r') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:  # damaged line
+                continue
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile of values by the nearest rank method, or
+    None if there are no values.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(int(-(-p * len(values) // 100)), 1)  # rounded up
+    return values[rank - 1]
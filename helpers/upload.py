@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from cookielib import CookieJar
+from hashlib import sha1
+from os import path, urandom
+from socket import error as SocketError
+from time import sleep
+from urllib import urlencode
+from urllib2 import build_opener, HTTPCookieProcessor, HTTPError, Request, \
+    URLError
+
+from helpers import template
+
+USER_AGENT = 'oa-put/2012-05-31'
+COMMENT = 'Uploaded with the Open Access Media Importer.'
+
+# Files larger than this are uploaded in chunks of this size to the upload
+# stash and published from there, so no request has to carry a whole video.
+CHUNK_SIZE = 4194304  # (4MiB)
+
+# Seconds of database replication lag at which the wiki should refuse
+# requests, see <https://www.mediawiki.org/wiki/Manual:Maxlag_parameter>.
+MAXLAG = 5
+
+# API error codes after which a request may succeed if it is sent again.
+TRANSIENT_ERRORS = ['maxlag', 'ratelimited', 'readonly',
+    'internal_api_error_DBQueryError']
+
+# Number of titles the API accepts in one query.
+BATCH_SIZE = 50
+
+# API error codes telling that an upload stash key is no longer valid.
+STASH_ERRORS = ['stashfailed', 'missingresult', 'invalid-file-key',
+    'stashnosuchfilekey', 'filekey-not-found']
+
+class APIError(Exception):
+    def __init__(self, code, info, retry_after=None):
+        Exception.__init__(self, '%s: %s' % (code, info))
+        self.code = code
+        self.info = info
+        self.retry_after = retry_after
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+def _encode_multipart(params, files):
+    """
+    Returns content type and body of a multipart/form-data request with
+    the given parameters and files, which map field names to (filename,
+    data) tuples.
+    """
+    boundary = urandom(16).encode('hex')
+    parts = []
+    for name, value in params.items():
+        parts.append('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % \
+            (boundary, name, _encode(value)))
+    for name, (filename, data) in files.items():
+        parts.append('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: application/octet-stream\r\n\r\n' % \
+            (boundary, name, _encode(filename)))
+        parts.append(data)
+        parts.append('\r\n')
+    parts.append('--%s--\r\n' % boundary)
+    return 'multipart/form-data; boundary=%s' % boundary, ''.join(parts)
+
+class Session():
+    """
+    A logged in session with a MediaWiki API. The login cookies and the
+    edit token are kept, so one session can be shared by several upload
+    threads. Requests are retried with exponential backoff if the wiki is
+    lagged, rate limited or unreachable.
+    """
+    def __init__(self, api_url, retries=5, backoff=1.0):
+        self.api_url = api_url
+        self.retries = retries
+        self.backoff = backoff
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.token = None
+
+    def login(self, username, password):
+        login_token = self.request({'action': 'query', 'meta': 'tokens',
+            'type': 'login'})['query']['tokens']['logintoken']
+        result = self.request({'action': 'login', 'lgname': username,
+            'lgpassword': password, 'lgtoken': login_token})['login']
+        if result['result'] != 'Success':
+            raise APIError('login-failed', result.get('reason',
+                result['result']))
+        self.refresh_token()
+
+    def refresh_token(self):
+        self.token = self.request({'action': 'query',
+            'meta': 'tokens'})['query']['tokens']['csrftoken']
+
+    def _post(self, params, files):
+        if files:
+            content_type, body = _encode_multipart(params, files)
+        else:
+            content_type = 'application/x-www-form-urlencoded'
+            body = urlencode([(k, _encode(v)) for k, v in params.items()])
+        response = self.opener.open(Request(self.api_url, body, {
+            'User-Agent': USER_AGENT,
+            'Content-Type': content_type
+        }))
+        result = json.loads(response.read())
+        if 'error' in result:
+            try:
+                retry_after = int(response.info()['retry-after'])
+            except (KeyError, ValueError):  # header is missing or malformed
+                retry_after = None
+            raise APIError(result['error'].get('code'),
+                result['error'].get('info'), retry_after)
+        return result
+
+    def request(self, params, files=None):
+        """
+        Posts an API request and returns the decoded JSON response. files
+        maps field names to (filename, data) tuples. Raises APIError for
+        errors reported by the API.
+        """
+        params = dict(params, format='json', maxlag=MAXLAG)
+        attempt = 0
+        while True:
+            try:
+                return self._post(params, files)
+            except APIError, e:
+                if e.code == 'badtoken' and 'token' in params and \
+                    attempt < self.retries:
+                    self.refresh_token()
+                    params['token'] = self.token
+                    attempt += 1
+                    continue
+                if attempt >= self.retries or e.code not in TRANSIENT_ERRORS:
+                    raise
+                sleep(e.retry_after or self.backoff * 2 ** attempt)
+            except HTTPError, e:
+                if attempt >= self.retries or \
+                    (e.code < 500 and e.code != 429):  # Too Many Requests
+                    raise
+                sleep(self.backoff * 2 ** attempt)
+            except (URLError, SocketError):
+                if attempt >= self.retries:
+                    raise
+                sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+def _check(result, expected):
+    if result['result'] not in expected:
+        raise APIError('upload-' + result['result'].lower(),
+            ', '.join(sorted(result.get('warnings', {}).keys())))
+
+def upload(session, row, filename, chunk_size=CHUNK_SIZE, stash=None,
+    progress=None):
+    """
+    Uploads a converted material to the wiki, submitting its description
+    page, written from the material and article information in row, with
+    the upload. Returns the filename on the wiki.
+
+    Files larger than chunk_size are uploaded in chunks to the upload stash.
+    After every chunk, progress is called with stash key and offset; given
+    these as stash, an interrupted upload continues where it stopped.
+    """
+    wiki_filename = path.split(filename)[-1]
+    params = {
+        'action': 'upload',
+        'filename': wiki_filename,
+        'comment': COMMENT,
+        'text': template.page(row['authors'], row['title'], \
+            row['journal_title'], row['date'], row['article_url'], \
+            row['license_url'], row['copyright_holder'], row['label'], \
+            row['caption'], 'PLACE PMID HERE')
+    }
+    size = path.getsize(filename)
+
+    if size <= chunk_size:
+        with open(filename, 'rb') as f:
+            data = f.read()
+        result = session.request(dict(params, token=session.token),
+            {'file': (wiki_filename, data)})['upload']
+        _check(result, ['Success'])
+        return result.get('filename', wiki_filename)
+
+    stash_key, offset = stash or (None, 0)
+    with open(filename, 'rb') as f:
+        while offset < size:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            chunk_params = {
+                'action': 'upload',
+                'stash': 1,
+                'filename': wiki_filename,
+                'filesize': size,
+                'offset': offset,
+                'token': session.token
+            }
+            if stash_key is not None:
+                chunk_params['filekey'] = stash_key
+            try:
+                result = session.request(chunk_params,
+                    {'chunk': (wiki_filename, chunk)})['upload']
+            except APIError, e:
+                if stash_key is None or e.code not in STASH_ERRORS:
+                    raise
+                stash_key, offset = None, 0  # stash expired, start over
+                continue
+            _check(result, ['Continue', 'Success'])
+            stash_key = result['filekey']
+            offset = int(result.get('offset', offset + len(chunk)))
+            if progress is not None:
+                progress(stash_key, offset)
+
+    result = session.request(dict(params, filekey=stash_key,
+        token=session.token))['upload']
+    _check(result, ['Success'])
+    return result.get('filename', wiki_filename)
+
+def file_sha1(filename, blocksize=CHUNK_SIZE):
+    """
+    Returns the SHA-1 hex digest of a file, as reported by the wiki for
+    uploaded files.
+    """
+    h = sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if block == '':
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def find_duplicates(session, items, batch_size=BATCH_SIZE):
+    """
+    Looks up files on the wiki before they are uploaded. items are
+    dictionaries with the local filename as 'path' and its SHA-1 as 'sha1'.
+
+    Returns a dictionary mapping the local filenames of items that need not
+    be uploaded to a (kind, wiki filename) tuple. kind is 'uploaded' if a
+    file with the same name and content exists, 'conflict' if a file with
+    the same name but other content exists and 'duplicate' if the same
+    content exists under another name. Names are looked up batch_size at a
+    time; content is looked up only for names that do not exist, one at a
+    time, as the API takes only one SHA-1 per query.
+    """
+    duplicates = {}
+    unknown = []
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        titles = dict(
+            ('File:' + path.split(item['path'])[-1].decode('utf-8'), item)
+            for item in batch
+        )
+        result = session.request({
+            'action': 'query',
+            'prop': 'imageinfo',
+            'iiprop': 'sha1',
+            'titles': '|'.join(titles.keys())
+        })['query']
+        for normalized in result.get('normalized', []):
+            titles[normalized['to']] = titles[normalized['from']]
+        for page in result['pages'].values():
+            item = titles[page['title']]
+            wiki_filename = page['title'].split(':', 1)[1]
+            if 'imageinfo' not in page:  # no such file
+                unknown.append(item)
+            elif page['imageinfo'][0]['sha1'] == item['sha1']:
+                duplicates[item['path']] = ('uploaded', wiki_filename)
+            else:
+                duplicates[item['path']] = ('conflict', wiki_filename)
+
+    for item in unknown:
+        images = session.request({
+            'action': 'query',
+            'list': 'allimages',
+            'aisha1': item['sha1'],
+            'ailimit': 1
+        })['query']['allimages']
+        if images:
+            duplicates[item['path']] = ('duplicate', images[0]['name'])
+    return duplicates
+
+def redirect(session, wiki_filename, target_filename):
+    """
+    Creates a file description page that redirects to another file.
+    """
+    session.request({
+        'action': 'edit',
+        'title': 'File:' + wiki_filename,
+        'text': '#REDIRECT [[File:%s]]' % target_filename,
+        'summary': COMMENT,
+        'createonly': 1,
+        'token': session.token
+    })
+
+def resolve_duplicate(session, item, kind, wiki_filename):
+    """
+    Deals with a file found by find_duplicates() instead of uploading it.
+    A duplicate under another name gets a redirect to the existing file.
+    Returns the wiki filename of the material and None, or None and a
+    string describing why it could not be resolved.
+    """
+    if kind == 'uploaded':
+        return wiki_filename, None
+    if kind == 'conflict':
+        return None, 'A different file named “%s” exists on the wiki.' % \
+            wiki_filename.encode('utf-8')
+    try:
+        redirect(session, path.split(item['path'])[-1], wiki_filename)
+    except APIError, e:
+        return None, str(e)
+    return wiki_filename, None
@@ -0,0 +1,12 @@
+from importlib import import_module
+
+# Names of the modules in this package that can be given as source.
+SOURCES = ['dummy', 'pmc']
+
+def get_source(name):
+    """
+    Imports and returns the module of a source.
+    """
+    if name not in SOURCES:
+        raise KeyError(name)
+    return import_module('sources.' + name)
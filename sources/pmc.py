@@ -2,14 +2,16 @@
 # -*- coding: utf-8 -*-
 
 from datetime import date
-from os import listdir, path
-from urllib2 import urlopen, urlparse
-from xml.etree.cElementTree import dump, ElementTree
+from os import listdir, makedirs, path, remove, rename
+from time import time
+from xml.etree.cElementTree import dump, Element, ElementTree, iterparse
 # the C implementation of ElementTree is 5 to 20 times faster than the Python one
 
-from hashlib import md5
+import csv, re, tarfile, zlib
 
-import tarfile
+from helpers.licenses import LicenseResolver, merge_counts
+from helpers.records import Article, SupplementaryMaterial
+from helpers.shards import in_shard, shard_name
 
 # According to <ftp://ftp.ncbi.nlm.nih.gov/README.ftp>, this should be
 # 33554432 (32MiB) for best performance. Note that on slow connections,
@@ -17,76 +19,638 @@ import tarfile
 BUFSIZE = 33554432
 #BUFSIZE = 1024000  # (1024KB)
 
-def download_metadata(target_directory):
+def download_metadata(target_directory, segments=None):
     """
     Downloads files from PMC FTP server into given directory.
+
+    If a number of segments is given, all files are downloaded at the same
+    time, each split into that many concurrently downloaded byte ranges.
     """
+    base_url = 'https://ftp.ncbi.nlm.nih.gov/pub/pmc/'
     urls = [
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.A-B.tar.gz',
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.C-H.tar.gz',
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.I-N.tar.gz',
-        'ftp://ftp.ncbi.nlm.nih.gov/pub/pmc/articles.O-Z.tar.gz'
+        base_url + 'articles.A-B.tar.gz',
+        base_url + 'articles.C-H.tar.gz',
+        base_url + 'articles.I-N.tar.gz',
+        base_url + 'articles.O-Z.tar.gz'
     ]
+    # network code is only loaded when metadata is downloaded
+    import urlparse
+    from helpers import download
 
+    tasks = []
     for url in urls:
-        remote_file = urlopen(url)
-        total = int(remote_file.headers['content-length'])
-        completed = 0
-
         url_path = urlparse.urlsplit(url).path
         local_filename = path.join(target_directory, \
             url_path.split('/')[-1])
+        tasks.append((url, local_filename))
 
-        # if local file has same size as remote file, skip download
-        try:
-            if (path.getsize(local_filename) == total):
+    if segments is not None:
+        for completed, total in download.fetch_segmented(tasks, segments):
+            yield {
+                'url': base_url,
+                'completed': completed,
+                'total': total
+            }
+        return
+
+    for url, local_filename in tasks:
+        # files that are current are skipped, interrupted downloads resumed
+        for completed, total in download.fetch(url, local_filename, BUFSIZE):
+            yield {
+                'url': url,
+                'completed': completed,
+                'total': total
+            }
+
+def list_articles(target_directory, supplementary_materials=False, skip=[],
+    workers=1, changed_only=False, statistics=None, names=None,
+    unreferenced_materials=False, prefilter=False, mimetypes=None,
+    prefilter_check=0, filters=None, shard=None, manifests=None, pool=None):
+    """
+    Iterates over archive files in target_directory, yielding Article objects.
+
+    If a list of article names is given, only these articles are read from
+    the index created by build_index(), in the given order.
+
+    Supplementary materials are only listed if they are referenced in the
+    article text, unless unreferenced_materials is true.
+
+    If prefilter is true and supplementary materials are listed, articles
+    are searched for markup of supplementary materials with media, of one of
+    the given mimetypes if a list is given, before they are parsed. Only the
+    name and an empty list of materials are yielded for other articles. One
+    in every prefilter_check of them is parsed anyway, and counted as an
+    error if it has wanted materials.
+
+    Only articles that pass the given filters are yielded. filters is a
+    dictionary that may contain collections of 'journals' (journal titles),
+    'licenses' (license URLs) and 'mimetypes' (of which an article must have
+    media), and 'dates', a (first, last) tuple of ISO dates or their
+    beginnings, either of which may be None. Filters are applied to the
+    fields that are cheapest to extract first; other fields are extracted
+    only for articles that pass. Unlike articles rejected by the prefilter,
+    rejected articles are not yielded at all, so they are not stored and
+    are parsed again by later runs, which may use other filters. Articles
+    checked in spite of the prefilter are filtered, too.
+
+    If workers is greater than 1, articles are parsed in a pool of worker
+    processes. Results are yielded in the same order as in serial operation.
+    If a pool of that many processes is given, it is used instead of a new
+    one; threaded callers have to make it before starting other threads.
+
+    If a (k, n) shard is given, only articles of that shard are read from
+    the archives.
+
+    If a manifests list is given, a manifest of every archive is appended to
+    it after reading the archive, one per shard if a shard is given; pass
+    the list to write_manifests() once all yielded articles are stored. If
+    changed_only is true, only articles that are new or changed since the
+    manifest was written (or that are not in skip) are parsed; archives that
+    did not change at all are not read, unless some of their articles are
+    not in skip. If a
+    statistics dictionary is given, the numbers of skipped and parsed
+    articles and of articles in other shards are counted in it, as well as
+    every license statement that could not be resolved to a URL. Also
+    counted are decompressed bytes, seconds spent reading and parsing (in
+    parallel operation, summed over worker processes) and hits and misses
+    of the license statement memo, the decisions of the prefilter and the
+    articles rejected by each filter.
+    """
+    if statistics is None:
+        statistics = {}
+    for key in ['skipped', 'parsed', 'other-shards', 'bytes', 'read-seconds',
+        'parse-seconds', 'license-cache-hits', 'license-cache-misses']:
+        statistics.setdefault(key, 0)
+    if prefilter and supplementary_materials:
+        prefilter = Prefilter(mimetypes, prefilter_check)
+        for key in PREFILTER_COUNTERS:
+            statistics.setdefault(key, 0)
+    else:
+        prefilter = None  # all articles are parsed
+    for key in FILTER_COUNTERS:
+        statistics.setdefault(key, 0)
+    statistics.setdefault('unknown-licenses', {})
+    if names is not None:
+        members = _iter_indexed_members(target_directory, names, statistics)
+    else:
+        members = _iter_members(target_directory, skip, changed_only,
+            statistics, shard, manifests)
+    if workers > 1:
+        return _list_articles_parallel(members, supplementary_materials,
+            unreferenced_materials, prefilter, filters, workers, statistics,
+            pool)
+    return _list_articles_serial(members, supplementary_materials,
+        unreferenced_materials, prefilter, filters, statistics)
+
+def _list_articles_serial(members, supplementary_materials,
+    unreferenced_materials, prefilter, filters, statistics):
+    """
+    Parses articles one after another in the current process.
+    """
+    for name, content in members:
+        started = time()
+        content = content.read()  # decompressed here, to be timed apart
+        read = time()
+        result = _parse_member(name, content, supplementary_materials,
+            unreferenced_materials, prefilter, filters, statistics)
+        statistics['bytes'] += len(content)
+        statistics['read-seconds'] += read - started
+        statistics['parse-seconds'] += time() - read
+        merge_counts(statistics, license_resolver.pop_counts())
+        if license_resolver.unknown:
+            merge_counts(statistics['unknown-licenses'],
+                license_resolver.pop_unknown())
+        if result is not None:
+            yield result
+
+# Number of archive members sent to a worker process at once. Larger batches
+# reduce interprocess communication overhead, smaller ones keep memory low.
+BATCHSIZE = 64
+
+def _list_articles_parallel(members, supplementary_materials,
+    unreferenced_materials, prefilter, filters, workers, statistics,
+    pool=None):
+    """
+    Reads archive members in the current process and parses them in batches
+    using a pool of worker processes, a new one unless one is given. The
+    number of batches in flight is bounded, so memory usage does not depend
+    on archive size.
+    """
+    from collections import deque
+    from multiprocessing import Pool
+
+    own_pool = pool is None
+    if own_pool:
+        pool = Pool(workers)
+    pending = deque()
+    try:
+        for batch in _iter_member_batches(members, BATCHSIZE, statistics):
+            pending.append(pool.apply_async(_parse_member_batch,
+                (batch, supplementary_materials, unreferenced_materials,
+                prefilter, filters)))
+            while len(pending) > 2 * workers:
+                results, unknown_licenses, counts = pending.popleft().get()
+                merge_counts(statistics['unknown-licenses'], unknown_licenses)
+                merge_counts(statistics, counts)
+                for result in results:
+                    yield result
+        while pending:
+            results, unknown_licenses, counts = pending.popleft().get()
+            merge_counts(statistics['unknown-licenses'], unknown_licenses)
+            merge_counts(statistics, counts)
+            for result in results:
+                yield result
+        if own_pool:
+            pool.close()
+    finally:
+        if own_pool:
+            pool.terminate()
+            pool.join()
+
+def _list_archives(target_directory):
+    """
+    Returns the filenames of all metadata archives in target_directory.
+    """
+    return [
+        filename for filename in listdir(target_directory)
+        if filename.endswith('.tar.gz')
+    ]
+
+def _iter_members(target_directory, skip, changed_only, statistics,
+    shard=None, manifests=None):
+    """
+    Iterates over archive files in target_directory, yielding name and
+    content of every article member that should be parsed.
+    """
+    for filename in _list_archives(target_directory):
+        archive_path = path.join(target_directory, filename)
+        archive_stat = _get_archive_stat(archive_path)
+        manifest = _read_manifest(archive_path, shard)
+        if not changed_only or manifest is None:
+            known_members = {}
+        else:
+            known_archive_stat, known_members = manifest
+            known_names = [
+                name for name in known_members
+                if path.splitext(name)[1] == '.nxml' and \
+                    in_shard(name, shard)
+            ]
+            # An unchanged archive still has to be read if some of its
+            # articles were never stored, e.g. because filters rejected them.
+            if archive_stat == known_archive_stat and \
+                all(name in skip for name in known_names):
+                statistics['skipped'] += len(known_names)
                 continue
-        except OSError:  # local file does not exist
-            pass
-
-        with open(local_filename,'wb') as local_file:
-            while True:
-                chunk = remote_file.read(BUFSIZE)
-                if chunk != '':
-                    local_file.write(chunk)
-                    completed += len(chunk)
-                    yield {
-                        'url': url,
-                        'completed': completed,
-                        'total': total
-                    }
-                else:
-                    break
 
-def list_articles(target_directory, supplementary_materials=False, skip=[]):
+        members = []
+        with tarfile.open(archive_path) as archive:
+            for item in archive:
+                member = (item.name, item.size, int(item.mtime),
+                    item.offset_data)
+                members.append(member)
+                if path.splitext(item.name)[1] != '.nxml':
+                    continue
+                if not in_shard(item.name, shard):
+                    statistics['other-shards'] += 1
+                    continue
+                known_member = known_members.get(item.name)
+                if item.name in skip and (known_member is None or \
+                    known_member[:2] == member[1:3]):
+                    statistics['skipped'] += 1
+                    continue
+                statistics['parsed'] += 1
+                content = archive.extractfile(item)
+                yield item.name, content
+        if manifests is not None:
+            manifests.append((archive_path, archive_stat, members, shard))
+
+def _get_archive_stat(archive_path):
+    """
+    Returns size and modification time of an archive file.
+    """
+    return (path.getsize(archive_path), int(path.getmtime(archive_path)))
+
+# A manifest is a CSV file stored next to its archive. The first row contains
+# size and modification time of the archive, every other row name, size,
+# modification time and offset (in the uncompressed stream) of a member.
+# Shards are read at different times, so each has manifests of its own.
+MANIFEST_SUFFIX = '.manifest'
+
+def _get_manifest_path(archive_path, shard=None):
+    if shard is None:
+        return archive_path + MANIFEST_SUFFIX
+    return '%s.%s%s' % (archive_path, shard_name(shard), MANIFEST_SUFFIX)
+
+def _read_manifest(archive_path, shard=None):
+    """
+    Returns archive size and modification time and a dictionary mapping
+    member names to size, modification time and offset, or None if no
+    manifest has been recorded for the archive (and shard) yet.
+    """
+    try:
+        with open(_get_manifest_path(archive_path, shard), 'r') as f:
+            reader = csv.reader(f)
+            archive_stat = tuple(int(value) for value in reader.next())
+            members = {}
+            for row in reader:
+                members[row[0]] = tuple(int(value) for value in row[1:])
+            return archive_stat, members
+    except (IOError, StopIteration):  # no manifest
+        return None
+
+def write_manifests(manifests):
+    """
+    Writes the manifests collected by list_articles(). Articles of an
+    archive with a manifest are only parsed again by changed_only if they
+    changed, so this must be called only after they are stored.
+    """
+    for archive_path, archive_stat, members, shard in manifests:
+        _write_manifest(archive_path, archive_stat, members, shard)
+
+def _write_manifest(archive_path, archive_stat, members, shard=None):
+    """
+    Records a manifest for an archive, given size and modification time of
+    the archive and a list of (name, size, modification time, offset) tuples.
+    """
+    manifest_path = _get_manifest_path(archive_path, shard)
+    temporary_path = manifest_path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(archive_stat)
+        writer.writerows(members)
+    rename(temporary_path, manifest_path)
+
+# Articles are stored in per-journal shards below the index directory. Every
+# article is a separate gzip member of its shard, so it can be decompressed
+# on its own given its offset and length, which are kept in an index database.
+INDEX_DIRECTORY = 'index'
+INDEX_FILENAME = 'index.sqlite'
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    filename TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime INTEGER
+);
+CREATE TABLE IF NOT EXISTS members (
+    name TEXT PRIMARY KEY,
+    archive TEXT,
+    shard TEXT,
+    offset INTEGER,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS members_archive ON members (archive);
+"""
+
+def _open_index(target_directory):
     """
-    Iterates over archive files in target_directory, yielding article information.
+    Returns a connection to the index database, creating it if necessary.
     """
-    listing = listdir(target_directory)
-    for filename in listing:
-        with tarfile.open(path.join(target_directory, filename)) as archive:
+    import sqlite3
+    index_directory = path.join(target_directory, INDEX_DIRECTORY)
+    if not path.exists(index_directory):
+        makedirs(index_directory)
+    connection = sqlite3.connect(path.join(index_directory, INDEX_FILENAME))
+    connection.text_factory = str
+    connection.executescript(INDEX_SCHEMA)
+    return connection
+
+def build_index(target_directory):
+    """
+    Copies articles from archive files in target_directory into seekable
+    per-journal shards, so that single articles can be read quickly. Only
+    archives that changed since the last run are processed. Returns the
+    number of articles indexed.
+    """
+    connection = _open_index(target_directory)
+    index_directory = path.join(target_directory, INDEX_DIRECTORY)
+    count = 0
+    for filename in _list_archives(target_directory):
+        archive_path = path.join(target_directory, filename)
+        archive_stat = _get_archive_stat(archive_path)
+        known_archive_stat = connection.execute(
+            'SELECT size, mtime FROM archives WHERE filename = ?', (filename,)
+        ).fetchone()
+        if known_archive_stat == archive_stat:
+            continue
+
+        for (shard,) in connection.execute(
+            'SELECT DISTINCT shard FROM members WHERE archive = ?', (filename,)
+        ).fetchall():
+            try:
+                remove(path.join(index_directory, shard))
+            except OSError:  # shard does not exist
+                pass
+        connection.execute('DELETE FROM members WHERE archive = ?',
+            (filename,))
+
+        shard = shard_file = None
+        with tarfile.open(archive_path) as archive:
             for item in archive:
-                if item.name in skip:
+                if path.splitext(item.name)[1] != '.nxml':
                     continue
-                if path.splitext(item.name)[1] == '.nxml':
-                    content = archive.extractfile(item)
-                    tree = ElementTree()
-                    tree.parse(content)
-
-                    result = {}
-                    result['name'] = item.name
-                    result['article-contrib-authors'] = _get_article_contrib_authors(tree)
-                    result['article-title'] = _get_article_title(tree)
-                    result['article-abstract'] = _get_article_abstract(tree)
-                    result['journal-title'] = _get_journal_title(tree)
-                    result['article-date'] = _get_article_date(tree)
-                    result['article-url'] = _get_article_url(tree)
-                    result['article-license-url'] = _get_article_license_url(tree)
-                    result['article-copyright-holder'] = _get_article_copyright_holder(tree)
-
-                    if supplementary_materials:
-                        result['supplementary-materials'] = _get_supplementary_materials(tree)
-                    yield result
+                item_shard = item.name.split('/')[0] + '.nxml.gz'
+                if item_shard != shard:
+                    if shard_file is not None:
+                        shard_file.close()
+                    shard = item_shard
+                    shard_file = open(path.join(index_directory, shard), 'ab')
+                    shard_file.seek(0, 2)  # tell() is only valid after seeking
+                compressor = zlib.compressobj(6, zlib.DEFLATED,
+                    16 + zlib.MAX_WBITS)  # gzip header and trailer
+                data = compressor.compress(archive.extractfile(item).read()) + \
+                    compressor.flush()
+                offset = shard_file.tell()
+                shard_file.write(data)
+                connection.execute(
+                    'INSERT OR REPLACE INTO members VALUES (?,?,?,?,?)',
+                    (item.name, filename, shard, offset, len(data))
+                )
+                count += 1
+        if shard_file is not None:
+            shard_file.close()
+        connection.execute('INSERT OR REPLACE INTO archives VALUES (?,?,?)',
+            (filename,) + archive_stat)
+        connection.commit()
+    connection.close()
+    return count
+
+def _get_indexed_member(connection, index_directory, name):
+    """
+    Returns the content of an article from the index as a string, or None
+    if the article is not indexed.
+    """
+    row = connection.execute(
+        'SELECT shard, offset, length FROM members WHERE name = ?', (name,)
+    ).fetchone()
+    if row is None:
+        return None
+    shard, offset, length = row
+    with open(path.join(index_directory, shard), 'rb') as shard_file:
+        shard_file.seek(offset)
+        return zlib.decompress(shard_file.read(length), 16 + zlib.MAX_WBITS)
+
+def _iter_indexed_members(target_directory, names, statistics):
+    """
+    Yields name and content of every given article found in the index.
+    """
+    from StringIO import StringIO
+    connection = _open_index(target_directory)
+    index_directory = path.join(target_directory, INDEX_DIRECTORY)
+    for name in names:
+        content = _get_indexed_member(connection, index_directory, name)
+        if content is None:
+            statistics['skipped'] += 1
+            continue
+        statistics['parsed'] += 1
+        yield name, StringIO(content)
+    connection.close()
+
+def get_article(target_directory, name, supplementary_materials=False,
+    unreferenced_materials=False):
+    """
+    Returns information on a single article from the index created by
+    build_index(), or None if the article is not indexed.
+    """
+    for result in list_articles(target_directory, supplementary_materials,
+        names=[name], unreferenced_materials=unreferenced_materials):
+        return result
+
+def _iter_member_batches(members, batchsize, statistics):
+    """
+    Yields lists of (name, content) tuples, content being a string.
+    """
+    batch = []
+    for name, content in members:
+        started = time()
+        content = content.read()
+        statistics['read-seconds'] += time() - started
+        statistics['bytes'] += len(content)
+        batch.append((name, content))
+        if len(batch) == batchsize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _parse_member_batch(batch, supplementary_materials,
+    unreferenced_materials, prefilter, filters):
+    """
+    Given a list of (name, content) tuples, returns a list of information on
+    the articles that pass filters, the counts of unknown license statements
+    encountered and counts of seconds spent parsing, license statement memo
+    use, prefilter decisions and filter rejections. This runs in a worker
+    process.
+    """
+    started = time()
+    counts = dict.fromkeys(PREFILTER_COUNTERS + FILTER_COUNTERS, 0)
+    results = []
+    for name, content in batch:
+        result = _parse_member(name, content, supplementary_materials,
+            unreferenced_materials, prefilter, filters, counts)
+        if result is not None:
+            results.append(result)
+    counts.update(license_resolver.pop_counts())
+    counts['parse-seconds'] = time() - started
+    return results, license_resolver.pop_unknown(), counts
+
+# Counters of prefilter decisions: articles passed on to be parsed, passed
+# articles without supplementary materials, rejected articles, rejected
+# articles parsed anyway for checking and those that had wanted materials.
+PREFILTER_COUNTERS = ['prefilter-passed', 'prefilter-false-positives',
+    'prefilter-rejected', 'prefilter-checked', 'prefilter-errors']
+
+# Every article from which supplementary materials can be listed contains
+# these, as materials without media are ignored.
+PREFILTER_MARKERS = ['<supplementary-material', '<media']
+_mimetype_attribute = re.compile(r'\smimetype\s*=\s*["\']([^"\']*)["\']')
+
+class Prefilter():
+    """
+    Decides from the raw bytes of an article, without parsing it, whether it
+    may have supplementary materials. If a list of mimetypes is given, only
+    materials of these mimetypes are wanted. Every check-th rejected article
+    (selected by a checksum of its name) is parsed anyway, to verify the
+    decision; 0 disables checking.
+    """
+    def __init__(self, mimetypes=None, check=0):
+        self.mimetypes = mimetypes
+        self.check = check
+
+    def accepts(self, content):
+        for marker in PREFILTER_MARKERS:
+            if marker not in content:
+                return False
+        if self.mimetypes is None:
+            return True
+        for mimetype in _mimetype_attribute.findall(content):
+            if mimetype in self.mimetypes:
+                return True
+        return False
+
+    def should_check(self, name):
+        return self.check > 0 and zlib.crc32(name) % self.check == 0
+
+    def is_wanted(self, materials):
+        return any(
+            self.mimetypes is None or material.mimetype in self.mimetypes
+            for material in materials
+        )
+
+def _parse_member(name, content, supplementary_materials,
+    unreferenced_materials, prefilter, filters, counts):
+    """
+    Given an article name and its content as a string, returns article
+    information, unless prefilter rejects it, or None if filters reject it.
+    Prefilter decisions and filter rejections are counted in counts.
+    """
+    from StringIO import StringIO
+    if prefilter is None:
+        return _parse_article(name, StringIO(content),
+            supplementary_materials, unreferenced_materials, filters, counts)
+
+    if prefilter.accepts(content):
+        counts['prefilter-passed'] += 1
+        result = _parse_article(name, StringIO(content),
+            supplementary_materials, unreferenced_materials, filters, counts)
+        if result is not None and \
+            not prefilter.is_wanted(result.materials):
+            counts['prefilter-false-positives'] += 1
+        return result
+
+    counts['prefilter-rejected'] += 1
+    if not prefilter.should_check(name):
+        return Article(name, materials=[])
+    counts['prefilter-checked'] += 1
+    result = _parse_article(name, StringIO(content), supplementary_materials,
+        unreferenced_materials, filters, counts)
+    if result is not None and prefilter.is_wanted(result.materials):
+        counts['prefilter-errors'] += 1
+    return result
+
+# Counters of articles rejected by each filter, in the order in which the
+# filters are applied.
+FILTER_COUNTERS = ['rejected-by-journal', 'rejected-by-date',
+    'rejected-by-license', 'rejected-by-mimetype']
+
+def _parse_article(name, content, supplementary_materials,
+    unreferenced_materials=False, filters=None, counts=None):
+    """
+    Given an article name and a file-like object, returns article information,
+    or None if the article is rejected by filters, counting the rejection in
+    counts.
+    """
+    filters = filters or {}
+    tree = _parse_article_tree(content,
+        supplementary_materials or 'mimetypes' in filters)
+
+    def reject(key):
+        if counts is not None:
+            counts['rejected-by-' + key] += 1
+
+    journal_title = _get_journal_title(tree)
+    if 'journals' in filters and journal_title not in filters['journals']:
+        return reject('journal')
+    article_date = _get_article_date(tree)
+    if 'dates' in filters:
+        first, last = filters['dates']
+        if (first is not None and article_date < first) or \
+            (last is not None and article_date[:len(last)] > last):
+            return reject('date')
+    license_url = _get_article_license_url(tree)
+    if 'licenses' in filters and license_url not in filters['licenses']:
+        return reject('license')
+    if 'mimetypes' in filters and \
+        not _has_media(tree, filters['mimetypes']):
+        return reject('mimetype')
+
+    materials = None
+    if supplementary_materials:
+        materials = _get_supplementary_materials(tree, unreferenced_materials)
+    return Article(
+        name,
+        authors=_get_article_contrib_authors(tree),
+        title=_get_article_title(tree),
+        abstract=_get_article_abstract(tree),
+        journal_title=journal_title,
+        date=article_date,
+        url=_get_article_url(tree),
+        license_url=license_url,
+        copyright_holder=_get_article_copyright_holder(tree),
+        materials=materials
+    )
+
+def _parse_article_tree(content, supplementary_materials):
+    """
+    Given a file-like object, returns an ElementTree that contains only the
+    parts of the article needed to extract article information: the front
+    matter and, if supplementary_materials is true, supplementary materials
+    and cross-references to them in document order.
+
+    The article is parsed incrementally; all other elements are cleared as
+    soon as they are parsed. If supplementary_materials is false, parsing
+    stops after the front matter.
+    """
+    root = Element('article')
+    keep = 0  # depth inside front matter or supplementary material
+    for event, element in iterparse(content, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if keep or tag == 'front' or (supplementary_materials and \
+                tag == 'supplementary-material'):
+                keep += 1
+            continue
+        if keep:
+            keep -= 1
+            if keep == 0:
+                root.append(element)
+                if tag == 'front' and not supplementary_materials:
+                    break
+        elif tag == 'xref' and supplementary_materials and \
+            element.get('ref-type') == 'supplementary-material':
+            root.append(element)
+        else:
+            element.clear()
+    return ElementTree(root)
 
 def _get_article_contrib_authors(tree):
     from sys import stderr
@@ -382,6 +946,8 @@ http://dx.doi.org/10.1027/a000001]""": 'http://dx.doi.org/10.1027/a000001',
     """This is an open access article distributed under the terms of the Creative Commons Attribution License ( http://creativecommons.org/licenses/by/2.0 ), which permits unrestricted use, distribution, and reproduction in any medium, provided the original work is properly cited.""": 'http://creativecommons.org/licenses/by/2.0',
 }
 
+license_resolver = LicenseResolver(license_url_equivalents)
+
 def _get_article_license_url(tree):
     """
     Given an ElementTree, returns article license URL.
@@ -393,15 +959,7 @@ def _get_article_license_url(tree):
         return ''
     except KeyError:  # license statement is in plain text
         license_text = ' '.join(license.itertext()).encode('utf-8')
-        if license_text in license_url_equivalents:
-            return license_url_equivalents[license_text]
-        else:
-            # FIXME: revert this to an exception some time in the future
-            filename = '/tmp/pmc-' + md5(license_text).hexdigest()
-            with open(filename, 'w') as f:
-                f.write(license_text)
-                stderr.write("Unknown license statement:\n%s\n" % \
-                    str(license_text))
+        return license_resolver.resolve(license_text)
 
 def _get_article_copyright_holder(tree):
     """
@@ -415,56 +973,82 @@ def _get_article_copyright_holder(tree):
     except AttributeError:  # no copyright_holder known
         return ''
 
-from sys import stderr
-
-def _get_supplementary_materials(tree):
+def _get_supplementary_materials(tree, unreferenced_materials=False):
     """
-    Given an ElementTree, returns a list of article supplementary materials.
+    Given an ElementTree, returns a list of article supplementary materials,
+    in the order in which they are first referenced. Every material is listed
+    once, even if it is referenced several times. If unreferenced_materials
+    is true, materials that are never referenced are appended to the list.
     """
+    pmcid = None
+    index = {}  # maps supplementary material IDs to materials
+    found = []  # (ID, material) tuples in document order
+    for sup in tree.iter('supplementary-material'):
+        rid = sup.get('id')
+        if rid in index:
+            continue
+        if pmcid is None:
+            pmcid = _get_pmcid(tree)
+        material = _get_supplementary_material(sup, pmcid)
+        if material is None:
+            continue
+        if rid is not None:
+            index[rid] = material
+        found.append((rid, material))
+
     materials = []
     for xref in tree.iter('xref'):
-        try:
-            if xref.attrib['ref-type'] == 'supplementary-material':
-                rid = xref.attrib['rid']
-                sup = _get_supplementary_material(tree, rid)
-                if sup:
-                    materials.append(sup)
-        except KeyError:  # xref is missing ref-type or rid
-            pass
+        if xref.get('ref-type') != 'supplementary-material':
+            continue
+        material = index.pop(xref.get('rid'), None)
+        if material is not None:
+            materials.append(material)
+
+    if unreferenced_materials:
+        materials.extend(
+            material for rid, material in found
+            if rid is None or rid in index
+        )
     return materials
 
-def _get_supplementary_material(tree, rid):
+def _has_media(tree, mimetypes):
     """
-    Given an ElementTree and an rid, returns supplementary material as a dictionary
-    containing url, mimetype and label and caption.
+    Given an ElementTree, returns whether the article has supplementary
+    material media of one of the given mimetypes.
     """
-    for sup in tree.iter('supplementary-material'):
-        try:
-            if sup.attrib['id'] == rid:  # supplementary material found
-                result = {}
-                sup_tree = ElementTree(sup)
-
-                label = sup_tree.find('label')
-                result['label'] = ''
-                if label is not None:
-                    result['label'] = label.text
-
-                caption = sup_tree.find('caption')
-                result['caption'] = ''
-                if caption is not None:
-                    result['caption'] = ' '.join(caption.itertext())
-
-                media = sup_tree.find('media')
-                if media is not None:
-                    result['mimetype'] = media.attrib['mimetype']
-                    result['mime-subtype'] = media.attrib['mime-subtype']
-                    result['url'] = _get_supplementary_material_url(
-                        _get_pmcid(tree),
-                        media.attrib['{http://www.w3.org/1999/xlink}href']
-                    )
-                    return result
-        except KeyError:  # supplementary material has no ID
-            continue
+    for media in tree.iter('media'):
+        if media.get('mimetype') in mimetypes:
+            return True
+    return False
+
+def _get_supplementary_material(sup, pmcid):
+    """
+    Given a supplementary material element and a PubMed Central ID, returns
+    a SupplementaryMaterial, or None if it contains no media.
+    """
+    sup_tree = ElementTree(sup)
+    media = sup_tree.find('media')
+    if media is None:
+        return None
+    try:
+        mimetype = media.attrib['mimetype']
+        mime_subtype = media.attrib['mime-subtype']
+        url = _get_supplementary_material_url(
+            pmcid,
+            media.attrib['{http://www.w3.org/1999/xlink}href']
+        )
+    except KeyError:  # media is missing mimetype or href
+        return None
+
+    label = sup_tree.find('label')
+    caption = sup_tree.find('caption')
+    return SupplementaryMaterial(
+        url,
+        label.text if label is not None else '',
+        ' '.join(caption.itertext()) if caption is not None else '',
+        mimetype,
+        mime_subtype
+    )
 
 def _get_pmcid(tree):
     """